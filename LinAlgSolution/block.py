@@ -195,12 +195,42 @@ class Index:
         # if we didn't find anything we return None
         return None
 
+"""
+The following class also indexes objects by their position, but keys a single
+dictionary by the position itself turned into a tuple of integers, so adding 
+and finding an element is a single hash lookup (no strings get built and no 
+lists get searched). Positions must be lattice points (whole numbers, though
+they can be Fractions). It has the same methods as Index.
+"""
+
+class PositionIndex:
+
+    def __init__(self):
+        self.elements = {}
+
+    def addElement(self, element):
+        key = positionKey(element.position)
+        if not key in self.elements:
+            self.elements[key] = element
+
+    def getElement(self, position):
+        return self.elements.get(positionKey(position))
+
+# this turns a position into the key PositionIndex uses for it. Every entry 
+# has to be a whole number (rounding anything else would quietly put it on 
+# top of some other position)
+def positionKey(position):
+    key = tuple([int(entry) for entry in position])
+    if key != tuple(position):
+        raise Issue('positions have to be whole numbers, %s is not' % (tuple(position),))
+    return key
+
 # this is just a container really
 class VertexPool:
 
     def __init__(self, dimensions, r=2):
         self.vertices = []
-        self.index = Index(r,0,dimensions)
+        self.index = PositionIndex()
         self.current_id = 0
         
     def getNewId(self):
@@ -225,7 +255,7 @@ class Block:
         self.r = r
         self.edge_indexes = []
         for i in range(0, num_vectors):
-            self.edge_indexes.append(Index(r,0,dimensions))
+            self.edge_indexes.append(PositionIndex())
         # used for checking
         self.dimensions = dimensions
 
@@ -0,0 +1,58 @@
+import sys
+import time
+from sympy import Matrix
+from kirky import Kirchhoff
+
+"""
+This times putting the edges and vertices of a Kirchhoff object's blocks into
+sets and dictionaries and looking them up again, which is all hashing and 
+comparing. For comparison it also times the same thing keyed by str(), which 
+is what edges used to be hashed by.
+
+Run it as
+    python benchmark_hashing.py [B] [number of grows] [repeats]
+where B is written like [[2,1],[1,2]] (the default). It only builds and grows
+the blocks, it never solves anything.
+"""
+
+def timed(function, repeats):
+    best = None
+    for i in range(0, repeats):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def setUse(items):
+    found = set(items)
+    for item in items:
+        if not item in found:
+            raise Exception('lost an item')
+
+def dictUse(items):
+    found = {}
+    for i in range(0, len(items)):
+        found[items[i]] = i
+    for i in range(0, len(items)):
+        if found[items[i]] != i:
+            raise Exception('lost an item')
+
+def main():
+    B = Matrix(eval(sys.argv[1])) if len(sys.argv) > 1 else Matrix([[2,1],[1,2]])
+    grows = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    k = Kirchhoff(B, B.T, [1] * B.shape[1])
+    for i in range(0, grows):
+        k.Grow(i % B.shape[0])
+    edges = k.block.edges + k.interior.edges
+    vertices = k.block.Vertices()
+    print('%s vertices, %s edges' % (len(vertices), len(edges)))
+    for name, items in [('edges', edges), ('vertices', vertices)]:
+        strings = lambda: [str(item) for item in items]
+        print('%10s set  %8.4f seconds (by str %8.4f seconds)' % (name, timed(lambda: setUse(items), repeats), timed(lambda: setUse(strings()), repeats)))
+        print('%10s dict %8.4f seconds (by str %8.4f seconds)' % (name, timed(lambda: dictUse(items), repeats), timed(lambda: dictUse(strings()), repeats)))
+
+if __name__ == '__main__':
+    main()
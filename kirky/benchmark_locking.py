@@ -0,0 +1,65 @@
+import sys
+import time
+from sympy import Matrix
+from kirky import Kirchhoff
+from kirky.symbolic import Web
+
+"""
+This times locking every edge weight of a big grown block, which is what 
+LockSolution does once a solution is found. We lock them all to zero (which 
+always satisfies the conditions) so we don't have to solve anything first. 
+Each lock spreads through the web to the vertex cuts the edge touches.
+
+We take the best of five runs.
+
+It also locks the first node of a long chain of nodes (each the only parent
+of the next) to show how long it takes for a lock to spread a long way.
+
+Run it as
+    python benchmark_locking.py [B] [number of grows] [chain length]
+where B is written like [[2,1],[1,2]] (the default).
+"""
+
+def lockBlock(k):
+    web = k.web
+    for node in k.block.edge_pool.edge_weights:
+        if not node.lock:
+            web.Lock(node, 0)
+
+def lockChain(length):
+    web = Web()
+    first = web.CreateNode()
+    last = first
+    for i in range(1, length):
+        node = web.CreateNode()
+        node.CreateParentGroup((last, 1))
+        last = node
+    start = time.time()
+    web.Lock(first, 1)
+    elapsed = time.time() - start
+    if not last.lock or last.value != 1:
+        raise Exception('the lock did not reach the end of the chain')
+    return elapsed
+
+def main():
+    B = Matrix(eval(sys.argv[1])) if len(sys.argv) > 1 else Matrix([[2,1],[1,2]])
+    grows = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    length = int(sys.argv[3]) if len(sys.argv) > 3 else 100000
+    k = Kirchhoff(B, B.T, [1] * B.shape[1], box=True)
+    for i in range(0, grows):
+        k.Grow(i % B.shape[0])
+    # we take the best of a few runs, unlocking in between
+    elapsed = None
+    for i in range(0, 5):
+        k.Unlock()
+        start = time.time()
+        lockBlock(k)
+        run = time.time() - start
+        if elapsed is None or run < elapsed:
+            elapsed = run
+    locked = len([node for node in k.web.nodes if node.lock])
+    print('locked %s edge weights (%s nodes in all) in %s seconds (%s errors)' % (len(k.block.edge_pool.edge_weights), locked, elapsed, len(k.web.errors)))
+    print('locked a chain of %s nodes in %s seconds' % (length, lockChain(length)))
+
+if __name__ == '__main__':
+    main()
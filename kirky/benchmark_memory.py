@@ -0,0 +1,151 @@
+import sys
+from fractions import Fraction
+from sympy import Matrix
+from kirky import Kirchhoff
+
+"""
+This measures how much memory the blocks of a Kirchhoff object take up, per
+vertex. It walks everything that can be reached from the base block and the
+interior (the vertex and edge pools, the web and all of its nodes, the edges
+and so on), adding up the size of each object once, and then prints the total
+split up by the type of object.
+
+To see what that saves, it also builds a copy of the same blocks laid out the
+way they used to be (see oldLayout) and prints how much that takes next to 
+it.
+
+Run it as
+    python benchmark_memory.py [B] [number of grows]
+where B is written like [[2,1],[1,2]] (the default). It only builds and grows
+the blocks, it never solves anything.
+"""
+
+# these are never counted (they are shared by everything)
+SKIP = (type, type(sys), type(len))
+
+def walk(root):
+    sizes = {}
+    seen = set()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, SKIP):
+            continue
+        seen.add(id(obj))
+        name = type(obj).__name__
+        sizes[name] = sizes.get(name, 0) + sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return sizes
+
+"""
+This copies the vertices, edges and web nodes of the blocks into the layout 
+they had before they were made compact: an object with its own __dict__ for 
+every vertex, edge and node, positions kept as lists of Fractions, and the 
+parent groups of each node (along with their lock counts and the node's 
+children) kept in dictionaries by group key. Each vertex holds its cut nodes,
+their group keys and a pair of edges (going out and coming in) for each 
+vector. We leave out the position index the vertex pool used to keep, so if 
+anything this makes the old layout look a bit better than it was.
+
+It gives back the vertices, edges and nodes, which is everything reachable
+from the old blocks.
+"""
+class OldNode:
+    pass
+
+class OldVertex:
+    pass
+
+class OldEdge:
+    pass
+
+class OldWeb:
+    pass
+
+def oldLayout(k):
+    web = OldWeb()
+    web.nodes = []
+    for node in k.web.nodes:
+        old = OldNode()
+        old.kind = node.kind
+        old.children = {}
+        old.parent_groups = {}
+        old.parent_group_locks = {}
+        old.next_key = 0
+        old.value = None
+        old.lock = False
+        old.web = web
+        old.id = node.id
+        old.weight_id = node.weight_id if node.kind == 'edge' else 0
+        web.nodes.append(old)
+    for node in k.web.nodes:
+        old = web.nodes[node.id]
+        for group in node.parent_groups:
+            key = old.next_key
+            old.next_key += 1
+            old.parent_groups[key] = [(web.nodes[parent.id], multiplier) for parent, multiplier in group]
+            old.parent_group_locks[key] = 0
+            for parent, multiplier in group:
+                web.nodes[parent.id].children.setdefault(key, []).append(old)
+    pool = k.block.vertex_pool
+    table = k.block.edge_pool
+    vertices = []
+    for id in range(0, pool.num_vertices):
+        vertex = OldVertex()
+        vertex.position = [Fraction(int(entry)) for entry in pool.coords[id]]
+        vertex.cut = [web.nodes[node_id] if node_id >= 0 else None for node_id in pool.cut_nodes[id].tolist()]
+        vertex.cut_group_keys = [key if key >= 0 else None for key in pool.cut_group_keys[id].tolist()]
+        vertex.edges = [[None, None] for i in range(0, pool.cut_size)]
+        vertices.append(vertex)
+    edges = []
+    for weight_id in range(0, table.current_id):
+        new = table.edges[weight_id]
+        edge = OldEdge()
+        edge.vector_id = new.vector_id
+        edge.num_edges = new.num_edges
+        edge.tail_position = [Fraction(entry) for entry in new.tail_position]
+        edge.head_position = [Fraction(entry) for entry in new.head_position]
+        tail = vertices[int(table.tail_ids[weight_id])]
+        head = vertices[int(table.head_ids[weight_id])]
+        edge.vertices = [tail, head]
+        edge.position = edge.head_position
+        edge.weight = web.nodes[new.weight.id]
+        tail.edges[edge.vector_id][0] = edge
+        head.edges[edge.vector_id][1] = edge
+        edges.append(edge)
+    return vertices, edges, web.nodes
+
+def main():
+    B = Matrix(eval(sys.argv[1])) if len(sys.argv) > 1 else Matrix([[2,1],[1,2]])
+    grows = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    k = Kirchhoff(B, B.T, [1] * B.shape[1])
+    for i in range(0, grows):
+        k.Grow(i % B.shape[0])
+    num_vertices = len(k.block.Vertices())
+    sizes = walk((k.block, k.interior))
+    total = sum(sizes.values())
+    print('%s vertices, %s edges, %s web nodes' % (num_vertices, len(k.block.edge_pool.edge_weights), len(k.web.nodes)))
+    for name in sorted(sizes, key=lambda name: -sizes[name]):
+        print('%20s %12s bytes %10.1f bytes per vertex' % (name, sizes[name], float(sizes[name]) / num_vertices))
+    print('%20s %12s bytes %10.1f bytes per vertex' % ('total', total, float(total) / num_vertices))
+    old_sizes = walk(oldLayout(k))
+    old_total = sum(old_sizes.values())
+    print('')
+    print('the same blocks laid out the old way take')
+    for name in sorted(old_sizes, key=lambda name: -old_sizes[name]):
+        print('%20s %12s bytes %10.1f bytes per vertex' % (name, old_sizes[name], float(old_sizes[name]) / num_vertices))
+    print('%20s %12s bytes %10.1f bytes per vertex' % ('total', old_total, float(old_total) / num_vertices))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+from sympy import Matrix
+from kirky import Kirchhoff
+from kirky.solvers import GetSolver
+
+"""
+This times the solvers on the linear system of a grown block, so you can see 
+which one to pick for blocks of the size you care about. Each solver gets the 
+whole system (we don't split it into components here) and we check that each
+one gives back the same basis as the first.
+
+On the box for [[2,1],[1,2]] we got
+    grows   system          sparse   modular   svd
+    6       578 x 1024      2.0s     3.9s      1.0s
+    7       1122 x 2048     5.4s     14.6s     5.7s
+    8       2178 x 4096     14.3s    44.5s     38.4s
+so svd only pays off on smaller systems. The dense decomposition it does 
+takes time that grows with the cube of the number of columns, which the 
+exact solvers (which get to take advantage of how sparse the system is) 
+soon beat.
+
+Run it as
+    python benchmark_solvers.py [B] [number of grows] [solvers]
+where B is written like [[2,1],[1,2]] (the default) and solvers is a comma 
+separated list of solver names (sparse,modular,svd by default).
+"""
+
+def main():
+    B = Matrix(eval(sys.argv[1])) if len(sys.argv) > 1 else Matrix([[2,1],[1,2]])
+    grows = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    names = sys.argv[3].split(',') if len(sys.argv) > 3 else ['sparse', 'modular', 'svd']
+    # we don't want to see everything Kirchhoff and the solvers print
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    k = Kirchhoff(B, B.T, [1] * B.shape[1], box=True)
+    for i in range(0, grows):
+        k.Grow(i % B.shape[0])
+    k.GenerateLinearSystem()
+    system = k.linear_system
+    results = []
+    for name in names:
+        start = time.time()
+        basis = GetSolver(name).Solve(system)
+        results.append((name, time.time() - start, basis))
+    sys.stdout = stdout
+    print('system is %s by %s' % system.shape)
+    for name, elapsed, basis in results:
+        same = 'same' if basis == results[0][2] else 'DIFFERENT'
+        print('%12s %10.2f seconds %6s vectors (%s basis)' % (name, elapsed, len(basis), same))
+
+if __name__ == '__main__':
+    main()
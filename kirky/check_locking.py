@@ -0,0 +1,103 @@
+import os
+import sys
+from sympy import Matrix
+from kirky import Kirchhoff
+
+"""
+This checks that the incidence matrix always follows whatever is locked in
+the web, however it got locked. For a few condition blocks it finds the
+Kirchhoff graph and then
+ * rolls the solution back, after which every cut should be zero
+ * locks a few edge weights by hand with Web.Lock
+ * unlocks everything, after which every cut should be zero again
+ * locks the solution back in with Web.LockAll rather than LockSolution
+and gets the incidence matrix after each of those. Every entry should be the
+value of the edge going out of the vertex less the value of the one coming
+in (anything unlocked counting as zero). Whenever a whole solution is locked
+every entry should also be the value of the cut node itself, which is how
+the incidence matrix used to be read off.
+
+It prints a line for each block and step, and FAILED along with what didn't
+match if anything doesn't. Run it as
+    python check_locking.py
+"""
+
+BLOCKS = ['[[1,1],[3,2]]', '[[2,1],[1,2]]', '[[1,-1],[2,1]]']
+
+def weightValue(edge):
+    if edge is None or not edge.weight.lock:
+        return 0
+    return edge.weight.value
+
+# the incidence matrix worked out one vertex at a time from the weight nodes
+def fromWeights(k):
+    rows = []
+    for vertex in k.block.vertex_pool.Vertices():
+        rows.append([weightValue(out_edge) - weightValue(in_edge) for out_edge, in_edge in vertex.edges])
+    return Matrix(rows)
+
+# and worked out from the cut nodes
+def fromCuts(k):
+    rows = []
+    for vertex in k.block.vertex_pool.Vertices():
+        rows.append([node.value if node is not None and node.lock else 0 for node in vertex.cut])
+    return Matrix(rows)
+
+def check(B):
+    failures = []
+    lines = []
+    k = Kirchhoff(B, B.T, [1] * B.shape[1])
+    k.Find()
+    web = k.web
+    weights = k.block.edge_pool.edge_weights
+    solution = [k.solution[0][i, 0] for i in range(0, len(weights))]
+
+    def step(name, whole, zero=False):
+        k.GetIncidenceMatrix()
+        M = k.incidence_matrix
+        if M != fromWeights(k):
+            failures.append('%s: does not match the weights' % name)
+        if whole and M != fromCuts(k):
+            failures.append('%s: does not match the cuts' % name)
+        if zero and any(M):
+            failures.append('%s: not all zero' % name)
+        lines.append('%s %s: %s non-zero entries' % (B.tolist(), name, len([value for value in M if value])))
+
+    step('found', True)
+    web.RollBack()
+    step('rolled back', False, zero=True)
+    # we lock a handful of the weights that are in the solution by hand
+    picked = [i for i in range(0, len(weights)) if solution[i]][:3]
+    for i in picked:
+        if not weights[i].lock:
+            web.Lock(weights[i], solution[i])
+    step('locked %s by hand' % len(picked), False)
+    k.Unlock()
+    step('unlocked', False, zero=True)
+    web.LockAll(weights, solution)
+    step('locked all', True)
+    if web.errors:
+        failures.append('web errors after locking the solution: %s' % len(web.errors))
+    return lines, failures
+
+def main():
+    stdout = sys.stdout
+    devnull = open(os.devnull, 'w')
+    failed = False
+    for block in BLOCKS:
+        B = Matrix(eval(block))
+        # we don't want to see everything Kirchhoff prints
+        sys.stdout = devnull
+        lines, failures = check(B)
+        sys.stdout = stdout
+        for line in lines:
+            print(line)
+        for failure in failures:
+            print('FAILED: %s' % failure)
+        failed = failed or bool(failures)
+    print('FAILED' if failed else 'ALL OK')
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+from sympy import Matrix
+from kirky import Kirchhoff
+from kirky.sparse import exact
+from kirky.solvers import SOLVERS, GetSolver, ComponentSolver
+from kirky.transfer import LatticeNullity
+
+"""
+This checks every registered solver against sympy. For a few condition 
+blocks it grows the block a few times, both the shift-adding way and as a 
+box, and each time finds the nullspace of the linear system with sympy's 
+nullspace and with each of the solvers (and with each of them split up into
+connected components, see ComponentSolver). 
+
+Most of the solvers should give back exactly the basis sympy does. The ones 
+in SCALED give back a whole number multiple of each of those vectors instead
+(see fraction_free.py). The incremental solver is kept around from one growth
+to the next, so it gets checked on systems that were brought up to date 
+rather than built from scratch. For boxes we also check the dimension of the
+nullspace that LatticeNullity finds straight from the shape of the block.
+
+It prints a line for each block and how many grows it has had, and FAILED 
+along with what didn't match if anything doesn't. Run it as
+    python check_solvers.py [number of grows]
+(2 by default, more takes a lot longer since sympy works on dense matrices).
+"""
+
+BLOCKS = ['[[2,1],[1,2]]', '[[1,2],[2,1],[1,1]]', '[[1,-1],[2,1]]', '[[1,0,2],[-1,1,1]]']
+
+# these give a multiple of each of sympy's vectors rather than the vector itself
+SCALED = ['bareiss']
+
+# this tells whether each vector in basis is a non-zero multiple of the 
+# vector in the same place in expected
+def sameUpToScaling(basis, expected):
+    if len(basis) != len(expected):
+        return False
+    for k in range(0, len(basis)):
+        vector = basis[k]
+        reference = expected[k]
+        pivot = [i for i in range(0, len(reference)) if reference[i] != 0][0]
+        scale = exact(vector[pivot]) / exact(reference[pivot])
+        if scale == 0 or [exact(value) for value in vector] != [scale * value for value in reference]:
+            return False
+    return True
+
+def check(B, box, grows):
+    failures = []
+    k = Kirchhoff(B, B.T, [1] * B.shape[1], box=box)
+    incremental = GetSolver('incremental')
+    lines = []
+    for g in range(0, grows + 1):
+        if g:
+            k.Grow((g - 1) % B.shape[0])
+        k.GenerateLinearSystem()
+        system = k.linear_system
+        expected = [[exact(value) for value in column] for column in system.ToMatrix().nullspace()]
+        found = {}
+        for name in sorted(SOLVERS):
+            solver = incremental if name == 'incremental' else GetSolver(name)
+            found[name] = solver.Solve(system)
+            if name != 'incremental':
+                found['%s in components' % name] = ComponentSolver(name).Solve(system)
+        for name in sorted(found):
+            basis = [[exact(value) for value in vector] for vector in found[name]]
+            if name.split(' ')[0] in SCALED:
+                good = sameUpToScaling(basis, expected)
+            else:
+                good = basis == expected
+            if not good:
+                failures.append('%s after %s grows' % (name, g))
+        if box:
+            nullity = LatticeNullity(B, B.T, k.block.Size())
+            if nullity != len(expected):
+                failures.append('LatticeNullity after %s grows (%s not %s)' % (g, nullity, len(expected)))
+        lines.append('%s box=%s grows=%s system %s by %s nullity %s' % (B.tolist(), box, g, system.shape[0], system.shape[1], len(expected)))
+    return lines, failures
+
+def main():
+    grows = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    stdout = sys.stdout
+    devnull = open(os.devnull, 'w')
+    failed = False
+    for block in BLOCKS:
+        B = Matrix(eval(block))
+        for box in (False, True):
+            # we don't want to see everything Kirchhoff and the solvers print
+            sys.stdout = devnull
+            lines, failures = check(B, box, grows)
+            sys.stdout = stdout
+            for line in lines:
+                print(line)
+            for failure in failures:
+                print('FAILED: %s' % failure)
+            failed = failed or bool(failures)
+    print('FAILED' if failed else 'ALL OK')
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,98 @@
+import numpy as np
 from fractions import Fraction
 from pyx import canvas
 from .draw import DrawBlock
 from time import clock
 from .issue import Issue
 from sympy import Matrix
-from block_creation import createBaseBlock, createInteriorBlock
+from block_creation import createBaseBlock, createInteriorBlock, createBoxBlocks, extendBoxBlocks
+from .sparse import SparseSystem, ToColumns
+from .modular import ProbeNullity
+from .transfer import LatticeNullity
+from .solvers import GetSolver, ComponentSolver
 
 class Kirchhoff:
-    def __init__(self, B, conditions, multiples):
-        self.block = createBaseBlock(conditions, B)
-        self.interior = createInteriorBlock(conditions, multiples, self.block)
+    def __init__(self, B, conditions, multiples, solver='sparse', probe=True, decompose=True, workers=1, transfer=False, box=False):
+        # if this is set we split the linear system up into independent pieces
+        # and solve each of them on their own, using this many processes
+        self.decompose = decompose
+        self.workers = workers
+        # this is the object that finds our nullspaces (see solvers.py for 
+        # the ones we have)
+        self.SetSolver(solver)
+        # if this is set we check whether there is any nullspace at all (which 
+        # is cheap) before we go looking for it exactly (which is not)
+        self.probe = probe
+        # if this is set we do that check straight from the shape of the 
+        # block instead (see ProbeLattice) so we never build the linear system
+        # of a block that has no nullspace
+        self.transfer = transfer
+        # these keep track of how long we have spent probing and solving 
+        self.probe_time = 0
+        self.solve_time = 0
+        self.B = B
+        self.conditions = conditions
+        self.multiples = multiples
+        # if this is set we build (and grow) the blocks directly as boxes 
+        # rather than by shift-adding (see createBoxBlocks). This is much 
+        # faster for big blocks, but the edges come out in a different order
+        # so you may find a different (equally good) solution
+        self.box = box
+        if box:
+            self.block, self.interior = createBoxBlocks(conditions, B, multiples)
+        else:
+            self.block = createBaseBlock(conditions, B)
+            self.interior = createInteriorBlock(conditions, multiples, self.block)
         self.web = self.block.vertex_pool.web
         self.dimension = self.block.dimension
         self.solution = None
         self.incidence_matrix = None
         self.linear_system = None
+        # these let us keep the linear system up to date as the block grows:
+        # the number of web nodes whose rows are already in the system and 
+        # the rows that belong to each node (by node id)
+        self.emitted = 0
+        self.node_rows = {}
+        
+    """
+    This lets you choose which solver (by the name it was registered under in 
+    solvers.py) finds the nullspace of our linear system. You can switch 
+    between runs, but note that a fresh solver object is made each time so 
+    any state the old one had is lost.
+    
+    If self.decompose is set the solver gets wrapped up so that it solves each 
+    connected component of the system separately (see ComponentSolver). 
+    Solvers that hold on to the whole system between solves can't be split 
+    up like this so they are left alone. The pieces are spread over 
+    self.workers processes.
+    """
+    def SetSolver(self, name):
+        self.solver = GetSolver(name)
+        self.solver_name = name
+        if self.decompose and not getattr(self.solver, 'stateful', False):
+            self.solver = ComponentSolver(name, self.workers)
         
     """
     This method allows us to grow our block along a certain dimension. It does
     so by shift-adding the base block by the width of the block in that dimension
     and then shift-adding the interior by one as many times as the original base
     block was wide in that dimension
+    
+    Either way the block ends up as a box twice as wide along that dimension, 
+    so if we were asked to build boxes we just add on what is missing from 
+    that box instead (see extendBoxBlocks)
     """
     def Grow(self, dimension):
         print('-->growing along dimension %s' % dimension)
         start = clock()
         self.Unlock()
+        if self.box:
+            sizes = [int(size) for size in self.block.Size()]
+            sizes[dimension] *= 2
+            extendBoxBlocks(self.block, self.interior, self.conditions, self.multiples, sizes)
+            end = clock()
+            print('-->grew along dimension %s in %s seconds' % (dimension, (end-start)))
+            return
         # first we grab how far we are going to have to shift
         amount = int(self.block.Size()[dimension])
         # now we shift-add the baseblock by that amount
@@ -43,6 +110,7 @@ class Kirchhoff:
     """  
     def Unlock(self):
         self.web.Unlock()
+        self.block.edge_pool.ClearValues()
     
     """
     Once we have obtained a non-trivial null space for a specific block-size
@@ -56,20 +124,20 @@ class Kirchhoff:
     example you choose to enter 1 you will get the second vector if it exists.
     If it doesn't exist get prepared for an error.
     
-    Once a vector has been chosen, this method just runs through the edge weights
-    locking each one to its solution in the vector. And remember, because 
-    we based the order of the solution off of the order of the edge weights
-    in the edge pool this is pretty easy.
+    Once a vector has been chosen, this method just locks each of the edge 
+    weights to its solution in the vector. And remember, because we based the
+    order of the solution off of the order of the edge weights in the edge 
+    pool this is pretty easy. We lock them all in one go (see Web.LockAll) 
+    rather than one at a time.
     """
     def LockSolution(self, nullspace_vector_index=0):
         print('-->locking solution')
         start = clock()
         nullspace_vector = self.solution[nullspace_vector_index]
-        for i in range(0, len(self.block.edge_pool.edge_weights)):
-            node = self.block.edge_pool.edge_weights[i]
-            value = nullspace_vector[i,0]
-            if not node.lock:
-                self.web.Lock(node,value)
+        weights = self.block.edge_pool.edge_weights
+        self.web.LockAll(weights, [nullspace_vector[i,0] for i in range(0, len(weights))])
+        # and we keep the values in the edge pool's table as well
+        self.block.edge_pool.FillValues()
         end = clock()
         print('-->solution locked in %s seconds' % (end - start))
     
@@ -80,15 +148,19 @@ class Kirchhoff:
     index. The same index its weight has in the edge_pool's edge_weights. This 
     index is the column in which it appears in the matrix of our linear system
     
-    The following method then goes ahead and generates a matrix that contains
-    all of these conditions in such a form that this matrix M multiplied by 
-    a column containing the edge weights should equal zero. 
+    The following method then goes ahead and generates a sparse system that 
+    contains all of these conditions in such a form that this system M 
+    multiplied by a column containing the edge weights should equal zero. 
+    Each row only touches a handful of edge weights so we only ever store the 
+    non-zero entries (see SparseSystem in sparse.py). If you want the dense 
+    sympy matrix you can get it with self.linear_system.ToMatrix()
     
     How do we generate each of these rows of this matrix then? We follow the 
     following algorithm:
         * loop through every each of the symbolic nodes attached to our Kirchhoff 
             object
-        * for each such node we grab its edge parents using getEdgeParents
+        * for each such node we grab its edge parents (the parents in the 
+            parent group whose first parent is an edge weight)
         * for each such node we loop through its parent groups (note that the 
             only nodes with parents are vertex cut nodes)
         * for each parent group that isn't an edge parent group we create a new 
@@ -108,114 +180,236 @@ class Kirchhoff:
             add up to the sum to the child, so by subtracting the child, our 
             row, multiplied by the edge weights should equal zero)
             
-    Once this is done it sets self.linear_system to the found matrix
+    Once this is done it sets self.linear_system to the found system. The 
+    system is kept around, and after the block grows calling this again only 
+    adds what the growth added (see UpdateLinearSystem)
+    
+    We never actually walk the nodes one at a time though. When we bring the 
+    system up to date we build the rows of all of the nodes we need at once 
+    from the web laid out in arrays (see CompiledWeb.Rows), and when we build
+    the whole system at once we don't even need the web. The only nodes with a
+    non-edge parent group are the conditioned entries of the vertex cuts, and 
+    the row of the ith conditioned entry of a vertex always has the same 
+    shape (see VertexPool.CutNode): B[j,i] times the edges of the jth entry, 
+    less the edges of the entry itself. The vertex pool knows the edges in 
+    every entry of every cut (its edge_slots), so we can pick the columns of 
+    all of the rows out of that in one go (see cutRows). Both give exactly the rows the algorithm above does.
     """
     def GenerateLinearSystem(self):
+        # if we already have a system we only need to bring it up to date
+        if self.linear_system is not None:
+            self.UpdateLinearSystem()
+            return
         print('-->generating linear system')
         start = clock()
-        # first we need to generate the matrix that will hold our system
-        # to do this we need the number of rows and the length of each row
-        num_rows = self.FindNumRows()
         # the number of columns is just the number of edge weights we will be 
         # solving for
         num_edges = len(self.block.edge_pool.edge_weights) # this is the length of each row
-        matrix = Matrix(num_rows, num_edges, [0]*(num_rows * num_edges))
-        # now we can go ahead and fill in the non-zero bits in this matrix.
-        # to keep track of the row we are currently on we keep the following counter
-        row = 0
-        for node in self.web.nodes:
-            edge_parents = self.getEdgeParents(node)
-            for key in node.parent_groups:
-                # first we check to make sure this isn't the edge parent group
-                if node.parent_groups[key][0][0].kind == 'edge':
-                        continue
-                # now we go about replacing all of the parents with their edge
-                # edge weight parents
-                for parent_tuple in node.parent_groups[key]:
-                    parent = parent_tuple[0]
-                    parent_multiplier = parent_tuple[1]
-                    # now we get the edges to replace it
-                    parent_edge_parents = self.getEdgeParents(parent)
-                    # we now enter the edge weight info into our matrix
-                    for edge_tuple in parent_edge_parents:
-                        if edge_tuple:
-                            weight = edge_tuple[0]
-                            multiplier = edge_tuple[1]
-                            # we add this into the right column position in this row
-                            matrix[row, weight.weight_id] += multiplier * parent_multiplier
-                    # finally we add in this node's parents with a minus 1 affixed to 
-                    # each of their multipliers
-                    for edge_tuple in edge_parents:
-                        if edge_tuple:
-                            weight = edge_tuple[0]
-                            multiplier = edge_tuple[1]
-                            # we add this into the right column position in this row
-                            matrix[row, weight.weight_id] += multiplier * -1
-                # we increment because now we are done with that row
-                row += 1
+        system = SparseSystem(num_edges)
+        self.node_rows = {}
+        node_ids, rows = self.cutRows()
+        for i in range(0, len(rows)):
+            self.node_rows[node_ids[i]] = [system.AddRow(rows[i])]
+        self.emitted = len(self.web.nodes)
+        # everything that changed in the web so far is already in the system,
+        # and from now on the web keeps track of what changes
+        self.web.TakeChanged()
         end = clock()
-        print('-->generated linear system of size (%s, %s) in %s seconds' % (matrix.shape[0], matrix.shape[1], (end-start)))
-        self.linear_system = matrix 
+        print('-->generated linear system of size (%s, %s) with %s non-zero entries in %s seconds' % (system.shape[0], system.shape[1], system.NumNonZero(), (end-start)))
+        self.linear_system = system 
     
     """
-    This returns a list of length two. The first entry is for the first edge
-    weight found, and the second entry is for the second edge weight found. 
-    If in either case the edge weight doesn't exist the entry in the 
-    list there just defaults to None. If it does exist the entry is a tuple
-    with the edge weight being the first entry and its multiplier in the parent
-    group in which it was found being the second entry
+    Growing the block only ever adds things. New edge weights get appended to 
+    the edge pool (so they become new columns on the right) and new vertex cut 
+    nodes get appended to the web (so they become new rows at the bottom). The 
+    only thing that can happen to what was already there is that an existing 
+    vertex cut node picks up new edge weights as parents (when a new edge lands
+    on an old vertex). The web keeps track of which nodes had that happen.
+    
+    So rather than building the whole system again we:
+        * add a column for every new edge weight
+        * rebuild the rows of every node that picked up new parents, along 
+            with the rows of their children (whose rows are built from their 
+            parents' edge weights)
+        * add rows for every node that was created since we last looked
     
-    We find these two by looping through the node's parent groups and grabbing 
-    the parents from the one whose first node is of the type edge. If no such 
-    parent groups are found we just return [None,None]
+    The rows get built all at once from the web laid out in arrays (see 
+    Web.Compile), which only has to be brought up to date with what changed.
+    The result is exactly what GenerateLinearSystem would build from scratch, 
+    but the work is proportional to how much the block grew.
     """
-    def getEdgeParents(self, node):
-        # this gets the edge_weights that form the parent group of a node 
-        # returns a two list, with edge or None in each entry
-        parents = [None, None]
-        index = 0
-        for key in node.parent_groups:
-            # we check to see if this key represents an edge parent group
-            if not node.parent_groups[key][0][0].kind == 'edge':
+    def UpdateLinearSystem(self):
+        print('-->updating linear system')
+        start = clock()
+        changed = self.web.TakeChanged()
+        if changed is None:
+            # the web lost track of what changed (see Web.Unlock) so we have 
+            # to start over
+            self.linear_system = None
+            self.GenerateLinearSystem()
+            return
+        system = self.linear_system
+        num_edges = len(self.block.edge_pool.edge_weights)
+        system.AddColumns(num_edges - system.num_cols)
+        # first we find the rows that need rebuilding
+        stale = {}
+        for node in changed:
+            if node.id >= self.emitted:
                 continue
-            # okay we now know that this is the parent group with edges
-            for parent_tuple in node.parent_groups[key]:
-                # the parent group will contain the edge weight node and the 
-                # multipler in that order so we just set the entry at the 
-                # current index to exactly that
-                parents[index] = parent_tuple
-                index += 1
-            break
-        return parents
+            stale[node.id] = node
+            for children in node.children:
+                for child in children:
+                    if child.id < self.emitted:
+                        stale[child.id] = child
+        compiled = self.web.Compile()
+        stale_ids = sorted(stale)
+        owners, rows = compiled.Rows(stale_ids)
+        built = {}
+        for i in range(0, len(rows)):
+            built.setdefault(owners[i], []).append(rows[i])
+        refreshed = 0
+        for id in stale_ids:
+            rows = built.get(id, [])
+            indexes = self.node_rows.get(id, [])
+            if len(rows) != len(indexes):
+                # the node's groups changed shape so we have to start over
+                self.linear_system = None
+                self.GenerateLinearSystem()
+                return
+            for i in range(0, len(rows)):
+                system.SetRow(indexes[i], rows[i])
+            refreshed += len(rows)
+        # and now we add the rows for the new nodes
+        added = system.shape[0]
+        owners, rows = compiled.Rows(range(self.emitted, len(self.web.nodes)))
+        for i in range(0, len(rows)):
+            self.node_rows.setdefault(owners[i], []).append(system.AddRow(rows[i]))
+        added = system.shape[0] - added
+        self.emitted = len(self.web.nodes)
+        end = clock()
+        print('-->updated linear system to size (%s, %s) with %s non-zero entries (%s rows added, %s rows rebuilt) in %s seconds' % (system.shape[0], system.shape[1], system.NumNonZero(), added, refreshed, (end-start)))
     
+    """
+    This builds the rows of all of the conditioned vertex cut entries at once 
+    (as described above GenerateLinearSystem) and gives back the ids of their 
+    nodes and their rows, in the order of the node ids (which is the order 
+    the algorithm above builds them in).
+    
+    Each row has a pair of columns (the edge going out and the edge coming in)
+    for each entry of the cut it involves, and we gather all of those from the
+    vertex pool's edge_slots with a single lookup, padding the rows of entries
+    that involve fewer entries with -1 (no edge).
+    """
+    def cutRows(self):
+        pool = self.block.vertex_pool
+        m = pool.dimension
+        cut_nodes = pool.cut_nodes[:pool.num_vertices, m:]
+        vertex_ids, conditioned = np.nonzero(cut_nodes >= 0)
+        node_ids = cut_nodes[vertex_ids, conditioned]
+        order = np.argsort(node_ids, kind='mergesort')
+        vertex_ids = vertex_ids[order]
+        conditioned = conditioned[order]
+        node_ids = node_ids[order]
+        # for each conditioned entry, the entries its row involves and what 
+        # each of them gets multiplied by
+        width = max([len(pairs) for pairs in pool.template] + [0]) + 1
+        entries = np.zeros((len(pool.template), width), dtype=np.int64)
+        multipliers = []
+        for i in range(0, len(pool.template)):
+            pairs = pool.template[i] + [(m + i, -1)]
+            entries[i, :len(pairs)] = [j for j, multiplier in pairs]
+            entries[i, len(pairs):] = m + i
+            row_multipliers = []
+            for j, multiplier in pairs:
+                row_multipliers.extend([multiplier, -multiplier])
+            multipliers.append(row_multipliers)
+        # and now the weight ids of the edges going out of and coming into 
+        # each of those entries, for every row at once
+        slots = pool.edge_slots[vertex_ids[:, np.newaxis], entries[conditioned]]
+        slots = slots.reshape(len(vertex_ids), 2 * width).tolist()
+        rows = []
+        for r in range(0, len(slots)):
+            row = {}
+            row_multipliers = multipliers[conditioned[r]]
+            columns = slots[r]
+            for k in range(0, len(row_multipliers)):
+                if columns[k] >= 0:
+                    row[columns[k]] = row.get(columns[k], 0) + row_multipliers[k]
+            rows.append(row)
+        return node_ids.tolist(), rows
+
     """
     This runs through the nodes attached to our object finds the number of
     none-edge parent groups. This corresponds to the number of rows that will 
     be in our linear system.
     """
     def FindNumRows(self):
-        count = 0
-        for node in self.web.nodes:
-            # we skip things that are strictly edges
-            for key in node.parent_groups:
-                # now we check to make sure this isn't a edge_weight parent group
-                if node.parent_groups[key][0][0].kind == 'edge':
-                        continue
-                count += 1
-        return count
+        return self.web.Compile().NumRows()
     
     """
     This is where we plug in our nullspace finder. It simply looks for the 
-    nullspace of self.linear_system and sets self.solution to what it finds
+    nullspace of self.linear_system, using whichever solver was chosen (see
+    SetSolver), and sets self.solution to what it finds.
+    The nullspace is handed back as a list of sympy column matrices (just 
+    like sympy's nullspace would)
     """
     def SolveLinearSystem(self):
-        print('-->looking for nullspace')
+        print('-->looking for nullspace (%s)' % self.solver_name)
         start = clock()
-        solution = self.linear_system.nullspace()
+        solution = ToColumns(self.solver.Solve(self.linear_system))
         end = clock()
         print('-->nullspace found in %s seconds' % (end - start))
+        self.solve_time += end - start
         self.solution = solution
     
+    """
+    This runs a quick check on the linear system to see if it has any 
+    nullspace at all (see ProbeNullity in modular.py). If it lets us know for 
+    certain that there is no nullspace we set self.solution to an empty list 
+    and return False so that we can grow right away. Otherwise we return True,
+    letting you know that the full solve is worth running.
+    """
+    def ProbeLinearSystem(self):
+        print('-->probing for nullspace')
+        start = clock()
+        nullity = ProbeNullity(self.linear_system)
+        end = clock()
+        print('-->probed nullspace (nullity at most %s) in %s seconds' % (nullity, (end - start)))
+        self.probe_time += end - start
+        if nullity == 0:
+            self.solution = []
+            return False
+        return True
+    
+    """
+    This does the same check as ProbeLinearSystem, but it works the answer out
+    from the size of the block alone (see transfer.py), sweeping through the
+    block a layer at a time. This never builds the block's linear system, so 
+    it is cheap even for really big blocks. By default it checks the block as 
+    it is now, but you can hand it the sizes (the largest position along each 
+    dimension) of any block you like, say to see how far you would have to 
+    grow before there is a nullspace.
+    
+    Just like ProbeLinearSystem, if it finds there is certainly no nullspace 
+    for the current block it sets self.solution to an empty list and returns 
+    False, otherwise it returns True.
+    """
+    def ProbeLattice(self, sizes=None):
+        current = sizes is None
+        if current:
+            sizes = self.block.Size()
+        print('-->probing for nullspace of block of size %s' % [int(size) for size in sizes])
+        start = clock()
+        nullity = LatticeNullity(self.B, self.conditions, sizes)
+        end = clock()
+        print('-->probed nullspace (nullity at most %s) in %s seconds' % (nullity, (end - start)))
+        self.probe_time += end - start
+        if nullity == 0:
+            if current:
+                self.solution = []
+            return False
+        return True
+    
     """
     This is where we plug in the drawing functionality from draw
     """
@@ -247,24 +441,21 @@ class Kirchhoff:
         start = clock()
         # first we generate the matrix we will be using
         num_cols = self.block.num_vectors
-        num_rows = len(self.block.Vertices())
-        M = Matrix(num_rows, num_cols, [0] * (num_rows * num_cols))
-        # we keep track of the row we are on with the following counter
-        row = 0
-        # we run the vertices setting their cut to the current row
-        for vertex in self.block.Vertices():
-            vector_id = 0
-            for node in vertex.cut:
-                # we check to make sure the node is locked
-                if node.lock:
-                    M[row, vector_id] = node.value
-                else:
-                    # if it isn't then we just set the current element to zero
-                    # because this node is obviously not part of our solution
-                    M[row, vector_id] = 0
-                vector_id += 1
-            # we are done with the row, so we increment our counter
-            row += 1
+        pool = self.block.vertex_pool
+        num_rows = pool.num_vertices
+        # each entry of a cut is the weight of the edge going out less the 
+        # weight of the edge coming in, so we look up the values of the edges 
+        # in every slot at once. Edges without a value (and missing edges, 
+        # which is what the extra zero at the end is for) count as zero, 
+        # because they are obviously not part of our solution. The values 
+        # only get filled in when we lock in a solution, so we fill them in 
+        # first in case anything was locked (or unlocked) some other way
+        self.block.edge_pool.FillValues()
+        values = [0 if value is None else value for value in self.block.edge_pool.values[:self.block.edge_pool.current_id]]
+        values = np.array(values + [0], dtype=object)
+        slots = pool.edge_slots[:num_rows]
+        cuts = values[slots[:, :, 0]] - values[slots[:, :, 1]]
+        M = Matrix(num_rows, num_cols, cuts.reshape(-1).tolist())
         end = clock()
         print('-->got incidence matrix in %s seconds' % (end - start))
         self.incidence_matrix = M
@@ -280,8 +471,18 @@ class Kirchhoff:
         # this counter holds the next direction to grow along
         current = 0
         while True:
-            self.GenerateLinearSystem()
-            self.SolveLinearSystem()
+            if self.transfer:
+                # we only build the linear system once we know there is 
+                # something to find
+                if self.ProbeLattice():
+                    self.GenerateLinearSystem()
+                    self.SolveLinearSystem()
+            else:
+                self.GenerateLinearSystem()
+                # we only go looking for the exact nullspace if the probe tells 
+                # us there might be one
+                if not self.probe or self.ProbeLinearSystem():
+                    self.SolveLinearSystem()
             if not self.solution:
                 self.Grow(current)
                 # we check to see if we still have another dimension 
@@ -297,4 +498,7 @@ class Kirchhoff:
         if file:
             self.Draw(file)
         end = clock()
+        if self.probe or self.transfer:
+            print('time spent probing: %s seconds' % self.probe_time)
+        print('time spent solving: %s seconds' % self.solve_time)
         print('total time elapsed: %s seconds' % (end - start))
\ No newline at end of file
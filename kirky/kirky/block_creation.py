@@ -1,7 +1,7 @@
+import numpy as np
 from .vertex import VertexPool
 from .edge import Block, EdgePool
-from fractions import Fraction
-from copy import copy
+from .issue import Issue
 
 """
 This function takes the conditions generated from scaling B^T so that it has all
@@ -47,26 +47,24 @@ def createBaseBlock(conditions, B):
     block = Block(vertex_pool, edge_pool)
     block.num_vectors = block.dimension + B.shape[1]
     # we add a single vertex which is the origin, and we will build from here
-    vertex = vertex_pool.GetVertex([Fraction(0,1)] * vertex_pool.dimension)
+    vertex = vertex_pool.GetVertex((0,) * vertex_pool.dimension)
     # we start by making the 1 sided hyper cube we will use
     for i in range(0, conditions.shape[1]):
         # first we create our new vector we will be
         # adding onto each vertex's position
-        vector = [Fraction(0,1)] * conditions.shape[1]
-        vector[i] = Fraction(1,1)
+        vector = [0] * conditions.shape[1]
+        vector[i] = 1
         # now we grab the blocks vertices so we can run through only the 'old'
         # ones after we've added the new
-        vertices = copy(block.Vertices())
+        vertices = block.Vertices()
         # now we shift the block by one in the ith dimension
         block.AddShift(1,i)
         # for each of the old vertices we add an edge going out from
         # them of our new type
         for vertex in vertices:
             # we create the new head position
-            head = []
-            for j in range(0, conditions.shape[1]):
-                head.append(vertex.position[j] + vector[j])
-            tail = copy(vertex.position)
+            tail = vertex.position
+            head = tuple([tail[j] + vector[j] for j in range(0, conditions.shape[1])])
             # now we create the edge that will go between these two positions
             edge = block.CreateEdge(head, tail,i)
             # and we attempt to add it
@@ -96,6 +94,18 @@ each do the following:
         and check to see if there is a vertex at this new position. If there is
         add the edge between them.
         do the same but subtract instead of add.
+
+We do each dependent vector for all of the vertices at once: we add the vector 
+to (and subtract it from) the whole array of vertex positions and look up 
+which of the results are vertices in one go. 
+
+Each edge would show up twice this way (adding at one end and subtracting at 
+the other) so we only make it the first time it shows up, going through the 
+vertices in order and adding before subtracting. The edge from a vertex at 
+index u to the one at index w (which is u's position plus the vector) shows up
+when adding at u and when subtracting at w, so we make it when adding if 
+u <= w and when subtracting otherwise. That way no edge is ever made just to 
+be thrown away, and the edges come out in the same order they always have.
         
 And that's it, we return the resulting block.
 
@@ -104,25 +114,130 @@ NOTE: the vertex and edge pools of the interior and exterior are the same.
 def createInteriorBlock(conditions, multiples, baseblock):
     interior = Block(baseblock.vertex_pool, baseblock.edge_pool)
     interior.num_vectors = baseblock.num_vectors
+    pool = baseblock.vertex_pool
+    positions = pool.coords[:pool.num_vertices].copy()
+    indexes = np.arange(0, len(positions))
     for i in range(0, conditions.shape[0]):
-        for vertex in baseblock.Vertices():
-            # first we add
-            desired_position = []
-            for j in range(0, len(vertex.position)):
-                desired_position.append(vertex.position[j] + conditions[i,j])
-            # now we want to see if there is a vertex at this position
-            has_vertex = baseblock.vertex_pool.HasVertex(desired_position)
-            if has_vertex:
-                edge = interior.CreateEdge(desired_position, copy(vertex.position), i + conditions.shape[1], multiples[i])
+        vector = np.array([int(conditions[i,j]) for j in range(0, conditions.shape[1])], dtype=np.int64)
+        added = positions + vector
+        subtracted = positions - vector
+        # these are the indexes of the vertices at those positions (or -1)
+        above = pool.FindIds(added)
+        below = pool.FindIds(subtracted)
+        make_added = (above >= 0) & (indexes <= above)
+        make_subtracted = (below >= 0) & (indexes < below)
+        for u in np.nonzero(make_added | make_subtracted)[0]:
+            position = tuple(positions[u].tolist())
+            if make_added[u]:
+                desired_position = tuple(added[u].tolist())
+                edge = interior.CreateEdge(desired_position, position, i + conditions.shape[1], multiples[i])
                 # I now add the edge and note it will add over the same vertex pool as the base block
                 interior.AddEdge(edge)
-            # then we subtract
-            desired_position = []
-            for j in range(0, len(vertex.position)):
-                desired_position.append(vertex.position[j] - conditions[i,j])
-            # now we want to see if there is a vertex at this position
-            has_vertex = baseblock.vertex_pool.HasVertex(desired_position)
-            if has_vertex:
-                edge = interior.CreateEdge(copy(vertex.position), desired_position, i + conditions.shape[1], multiples[i])
+            if make_subtracted[u]:
+                desired_position = tuple(subtracted[u].tolist())
+                edge = interior.CreateEdge(position, desired_position, i + conditions.shape[1], multiples[i])
                 interior.AddEdge(edge)
-    return interior
\ No newline at end of file
+    return interior
+
+"""
+The two functions above build the blocks the way we think about them: a cube
+that gets shifted and added onto itself over and over. But every shift walks 
+all of the edges made so far, so this takes time that grows with the square of
+the width of the block. Since we know exactly what we end up with (see 
+transfer.py) we can just make it directly instead:
+    * a vertex at every integer position from 0 up to sizes[i] along each 
+        dimension i
+    * an edge of each independent vector (the unit vector along dimension i) 
+        between every two vertices one apart along dimension i
+    * an edge of each dependent vector (a row of conditions) between every 
+        two vertices that far apart
+The edges of the independent vectors go in the base block and those of the 
+dependent vectors go in the interior, just like before.
+
+This gives back the base block and the interior for the box of the given sizes
+(by default the same size createBaseBlock makes).
+
+Note that while the blocks hold exactly the same vertices and edges as the 
+ones made the other way, they get made in a different order, so the weight ids
+(and so the columns of the linear system) are in a different order too.
+"""
+def createBoxBlocks(conditions, B, multiples, sizes=None):
+    if sizes is None:
+        sizes = baseSizes(conditions)
+    vertex_pool = VertexPool(B)
+    edge_pool = EdgePool()
+    block = Block(vertex_pool, edge_pool)
+    block.num_vectors = block.dimension + B.shape[1]
+    interior = Block(vertex_pool, edge_pool)
+    interior.num_vectors = block.num_vectors
+    extendBoxBlocks(block, interior, conditions, multiples, sizes)
+    return block, interior
+
+"""
+This takes a base block and interior made by createBoxBlocks (or by this) and 
+makes them into those of a bigger box with the given sizes, adding only the 
+vertices and edges that weren't there already. Since the old box is complete,
+an edge was already there exactly when both of its ends were in the old box. 
+So this takes time in proportion to what gets added.
+
+First the new vertices are made (in order of their positions) and then the 
+new edges, one vector at a time. Since we know where every new edge goes 
+we put them straight into the vertex pool (see AddNewEdge).
+"""
+def extendBoxBlocks(block, interior, conditions, multiples, sizes):
+    pool = block.vertex_pool
+    dimension = pool.dimension
+    sizes = [int(size) for size in sizes]
+    old = None
+    if pool.num_vertices:
+        old = [int(size) for size in pool.size]
+        for i in range(0, dimension):
+            if sizes[i] < old[i]:
+                raise Issue('a box can only be extended to a bigger box')
+    # every position in the new box, in order
+    points = np.indices([size + 1 for size in sizes]).reshape(dimension, -1).T
+    in_old = None
+    if old:
+        in_old = inBox(points, old)
+    for point in points if old is None else points[~in_old]:
+        pool.GetVertex(tuple(point.tolist()))
+    # now the edges, starting with the unit vectors
+    vectors = []
+    for i in range(0, dimension):
+        vector = [0] * dimension
+        vector[i] = 1
+        vectors.append((vector, block, 1))
+    for i in range(0, conditions.shape[0]):
+        vector = [int(conditions[i,j]) for j in range(0, dimension)]
+        vectors.append((vector, interior, multiples[i]))
+    for k in range(0, len(vectors)):
+        vector, target, num_edges = vectors[k]
+        heads = points + np.array(vector, dtype=np.int64)
+        new = inBox(heads, sizes)
+        if old:
+            new &= ~(in_old & inBox(heads, old))
+        indexes = np.nonzero(new)[0]
+        # we know these edges are new, and where their ends are, so we can 
+        # skip all of the checking AddEdge would do
+        tail_ids = pool.FindIds(points[indexes])
+        head_ids = pool.FindIds(heads[indexes])
+        for n in range(0, len(indexes)):
+            head = tuple(heads[indexes[n]].tolist())
+            tail = tuple(points[indexes[n]].tolist())
+            edge = target.CreateEdge(head, tail, k, num_edges)
+            target.AddNewEdge(edge, int(tail_ids[n]), int(head_ids[n]))
+
+# this finds the size createBaseBlock makes the block along each dimension
+def baseSizes(conditions):
+    sizes = []
+    for i in range(0, conditions.shape[1]):
+        side = 0
+        for element in conditions[:,i]:
+            side = max(side, abs(int(element)))
+        sizes.append(max(side, 1))
+    return sizes
+
+# this tells which of the positions (the rows of points) lie in the box from 
+# zero up to sizes
+def inBox(points, sizes):
+    return ((points >= 0) & (points <= np.array(sizes, dtype=np.int64))).all(axis=1)
@@ -1,27 +1,31 @@
+import numpy as np
 from pyx import path, deco, text
-from copy import copy
 
 def DrawEdge(edge, canvas):
-    head = copy(edge.head_position)
-    tail = copy(edge.tail_position)
+    value = None
+    if edge.weight.lock:
+        value = edge.weight.value
+    drawLine(edge.tail_position, edge.head_position, value, canvas)
+
+# this draws an edge from tail to head labelled with its value (if it has 
+# one), leaving out edges whose value is zero
+def drawLine(tail, head, value, canvas):
     reversed = False
     if tail[0] - head[0] > 0:
         reversed = True
-    for i in range(0, len(head)):
-        head[i] *= 4
-        tail[i] *= 4
-    weight = None 
+    # we scale the positions up for drawing
+    head = [4 * entry for entry in head]
+    tail = [4 * entry for entry in tail]
     string = None
-    if edge.weight.lock:
-        weight = edge.weight.value
-        if weight == 0:
+    if value is not None:
+        if value == 0:
             return
-        string = '%s' % weight
+        string = '%s' % value
         """
-        numerator = weight.numerator
+        numerator = value.numerator
         #if numerator == 0:
         #    return
-        denominator = weight.denominator
+        denominator = value.denominator
         string = '%s/%s' % (numerator, denominator)
         """
     if not reversed:
@@ -35,6 +39,22 @@ def DrawEdge(edge, canvas):
         else:
             canvas.stroke(path.line(head[0], head[1], tail[0], tail[1]), [deco.barrow])
             
+"""
+This draws every edge of a block. Rather than going through the edge objects
+we take the positions of the ends of all of the edges and their values from 
+the edge pool's table all at once (see EdgePool)
+
+The values in the table are only filled in when Kirchhoff locks in a 
+solution, so we fill them in from the weight nodes first in case anything 
+was locked some other way (say with Web.Lock or Web.LockAll)
+"""
 def DrawBlock(block, canvas):
-    for edge in block.edges:
-        DrawEdge(edge, canvas)
\ No newline at end of file
+    table = block.edge_pool
+    table.FillValues()
+    weight_ids = np.array(block.weight_ids, dtype=np.int64)
+    coords = block.vertex_pool.coords
+    tails = coords[table.tail_ids[weight_ids]].tolist()
+    heads = coords[table.head_ids[weight_ids]].tolist()
+    values = table.values[weight_ids]
+    for i in range(0, len(weight_ids)):
+        drawLine(tails[i], heads[i], values[i], canvas)
@@ -1,7 +1,12 @@
+import numpy as np
 from .issue import Issue
-from copy import copy
+from .vertex import PositionKey, grow
 
-class Edge:
+# there is one of these for every edge in a block so we use __slots__ to keep 
+# them small
+class Edge(object):
+
+    __slots__ = ('vector_id', 'num_edges', 'head_position', 'tail_position', 'vertices', 'position', 'weight', 'key')
 
     def __init__(self, head, tail, vector_id, multiples=1):
         # the vector id is the index of the column that this vector was named
@@ -11,16 +16,20 @@ class Edge:
         # is based off of (if any, remember 'basis edges' are selected by
         # the creator of the kirkhoff graph)
         self.num_edges = multiples
-        # these hold the head and tail positions of the edge
-        self.head_position = head
-        self.tail_position = tail
+        # these hold the head and tail positions of the edge, as tuples of 
+        # ints (anything else, like a list of Fractions, gets turned into one)
+        self.head_position = head if type(head) is tuple else PositionKey(head)
+        self.tail_position = tail if type(tail) is tuple else PositionKey(tail)
         # the first entry is the one at the tail, the second is the one at the
         # head
         self.vertices = [None, None]
         # finally we add a position so that this can be indexed by position
-        self.position = head
+        self.position = self.head_position
         # this will hold the weight node, which will get assigned by the block
         self.weight = None
+        # an edge is pinned down by its vector and where it starts, so this is
+        # what we hash and compare edges by
+        self.key = (vector_id, self.tail_position)
 
     """
     this tries to add a vertex. If the edge is not redundant this function will 
@@ -43,47 +52,105 @@ class Edge:
         return 'id:%shead:%stail:%s' % (self.vector_id, self.head_position, self.tail_position)
 
     def __hash__(self):
-        return hash(str(self))
+        return hash(self.key)
 
     def __repr__(self):
         return str(self)
 
     def __eq__(self, other):
-        if self.head_position != other.head_position:
-            return False
-        if self.tail_position != other.tail_position:
-            return False
-        if self.vector_id != other.vector_id:
-            return False
-        return True
+        return self.key == other.key and self.head_position == other.head_position
+
+    def __ne__(self, other):
+        return not self == other
 
 """    
 the following class handles creating, adding, and tracking edges 
 over a vertex pool. This allows us to keep collective state 
 about the edge weights
+
+Besides the weight nodes (and the edges they belong to) it keeps a table of 
+the edges in numpy arrays, with a row for each weight id (which is also the 
+column of the weight in the linear system):
+    * vector_ids: the vector each edge is along
+    * tail_ids, head_ids: the ids of the vertices at either end of each edge 
+        (or -1 until the edge is added to a block)
+    * multiplicities: the number of edges each one stands for (num_edges)
+    * values: the value each weight has in the locked solution (or None if 
+        there isn't one, see FillValues)
+so anything that needs to run through all of the edges can work on whole 
+columns at once. Like the vertex pool's arrays these grow by doubling.
 """
 class EdgePool:
     
     def __init__(self):
         self.edge_weights = []
+        # this holds the edge each weight belongs to (at the same index), 
+        # which is how the vertex pool finds edges from the weight ids it keeps
+        self.edges = []
         self.current_id = 0
+        self.vector_ids = np.zeros(0, dtype=np.int32)
+        self.tail_ids = np.zeros(0, dtype=np.int32)
+        self.head_ids = np.zeros(0, dtype=np.int32)
+        self.multiplicities = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=object)
         
     # these two methods allow us to keep track of the edge weight nodes
-    def AddEdgeWeight(self, weight):
+    def AddEdgeWeight(self, weight, edge=None):
         self.edge_weights.append(weight)
+        self.edges.append(edge)
         weight.weight_id = self.current_id
+        self.reserve(self.current_id + 1)
+        if edge is not None:
+            self.vector_ids[self.current_id] = edge.vector_id
+            self.multiplicities[self.current_id] = int(edge.num_edges)
+        self.tail_ids[self.current_id] = -1
+        self.head_ids[self.current_id] = -1
+        self.values[self.current_id] = None
         self.current_id += 1
     
     def RemoveEdgeWeight(self):
         self.edge_weights.pop(-1)
+        self.edges.pop(-1)
         self.current_id -= 1
 
+    # this records which vertices the edge with the given weight id joins
+    def SetEnds(self, weight_id, tail_id, head_id):
+        self.tail_ids[weight_id] = tail_id
+        self.head_ids[weight_id] = head_id
+
+    # this copies the values of the locked weights into self.values (and None
+    # for the ones that aren't locked)
+    def FillValues(self):
+        for i in range(0, self.current_id):
+            weight = self.edge_weights[i]
+            self.values[i] = weight.value if weight.lock else None
+
+    def ClearValues(self):
+        self.values[:self.current_id] = None
+
+    # this makes sure the arrays have room for count edges
+    def reserve(self, count):
+        capacity = self.vector_ids.shape[0]
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity, 16)
+        self.vector_ids = grow(self.vector_ids, capacity)
+        self.tail_ids = grow(self.tail_ids, capacity)
+        self.head_ids = grow(self.head_ids, capacity)
+        self.multiplicities = grow(self.multiplicities, capacity)
+        self.values = grow(self.values, capacity)
+
 class Block:
 
     def __init__(self, vertex_pool, edge_pool):
         self.vertex_pool = vertex_pool
         self.edge_pool = edge_pool
+        # the vertex pool looks its edges up in the edge pool
+        self.vertex_pool.edge_pool = edge_pool
         self.edges = []
+        # this holds the weight id of each edge in self.edges, which is where
+        # everything else about it is in the edge pool's table
+        self.weight_ids = []
         self.dimension = self.vertex_pool.dimension
         self.num_vectors = 0
 
@@ -103,10 +170,22 @@ class Block:
         if edge.AddVertices(tail_vertex, head_vertex):
             # if the edge was accepted we add it to the block's list of edges
             self.edges.append(edge)
+            self.weight_ids.append(edge.weight.weight_id)
+            self.edge_pool.SetEnds(edge.weight.weight_id, tail_vertex.id, head_vertex.id)
         else:
             self.edge_pool.RemoveEdgeWeight()
             self.vertex_pool.web.RemoveNode()
     
+    """
+    This adds an edge that we know is new between the vertices with the given 
+    ids (see VertexPool.AddNewEdge), skipping all of the checks
+    """
+    def AddNewEdge(self, edge, tail_id, head_id):
+        self.vertex_pool.AddNewEdge(tail_id, head_id, edge)
+        self.edges.append(edge)
+        self.weight_ids.append(edge.weight.weight_id)
+        self.edge_pool.SetEnds(edge.weight.weight_id, tail_id, head_id)
+
     """
     We use this to create an edge because this handles not only calling the 
     constructor for the edge, but creating a node for the edge weight and 
@@ -116,32 +195,51 @@ class Block:
         edge = Edge(tail_position, head_position, vector_id, num_edges)
         edge.weight = self.vertex_pool.web.CreateNode()
         edge.weight.kind = 'edge'
-        self.edge_pool.AddEdgeWeight(edge.weight)
+        self.edge_pool.AddEdgeWeight(edge.weight, edge)
         return edge
         
     def Size(self):
         return self.vertex_pool.size
         
     def Vertices(self):
-        return self.vertex_pool.vertices
+        return self.vertex_pool.Vertices()
     
     """
     This creates a copy of each edge in the block shifted by the input amount 
     in the direction of the input dimension and attempts to add each 
     into the block (creating vertices where needed through the implementation of 
     AddEdge). Thus this essentially creates a copy of the block and adds the block
-    and this copy together without ever duplicating an edge (because AddEdge 
-    will not add an edge if doing so we cause a duplicate)  
+    and this copy together without ever duplicating an edge.
+    
+    Most of the shifted edges usually land on edges that are already there, so
+    rather than making each one (and its weight node) just to throw it away, we
+    shift all of the positions at once (straight from the edge pool's table) 
+    and look up which shifted edges already exist: an edge is already there 
+    exactly when the vertex at its tail has an edge of the same vector going 
+    out. Only the edges that are actually new get created, in the same order 
+    as before.
     """
     def AddShift(self, amount, dimension):
         if dimension > self.dimension:
             raise Issue('this dimension is outside of the dimensions of this block')
         num = len(self.edges)
-        for i in range(0,num):
-            edge = self.edges[i]
-            new_head = copy(edge.head_position)
-            new_head[dimension] += amount
-            new_tail = copy(edge.tail_position)
-            new_tail[dimension] += amount
-            new_edge = self.CreateEdge(new_head,new_tail, edge.vector_id, edge.num_edges)
-            self.AddEdge(new_edge)
\ No newline at end of file
+        if num == 0:
+            return
+        table = self.edge_pool
+        weight_ids = np.array(self.weight_ids, dtype=np.int64)
+        vector_ids = table.vector_ids[weight_ids]
+        multiplicities = table.multiplicities[weight_ids]
+        tails = self.vertex_pool.coords[table.tail_ids[weight_ids]]
+        heads = self.vertex_pool.coords[table.head_ids[weight_ids]]
+        tails[:, dimension] += amount
+        heads[:, dimension] += amount
+        # now we find the shifted edges that are already there
+        pool = self.vertex_pool
+        ids = pool.FindIds(tails)
+        existing = ids >= 0
+        existing[existing] = pool.edge_slots[ids[existing], vector_ids[existing], 0] >= 0
+        for i in np.nonzero(~existing)[0]:
+            new_head = tuple(heads[i].tolist())
+            new_tail = tuple(tails[i].tolist())
+            new_edge = self.CreateEdge(new_head, new_tail, int(vector_ids[i]), int(multiplicities[i]))
+            self.AddEdge(new_edge)
@@ -0,0 +1,113 @@
+import numpy as np
+from .modular import IntegerTriplets, gcd
+
+"""
+This module finds nullspaces using fraction-free (Bareiss) elimination. Every
+entry of our linear systems is built out of small integers (the multipliers in
+the condition block and the +1/-1 orientations of the edges) so once each row
+is scaled to get rid of any denominators we can do the whole elimination in
+integers, never having to find a gcd along the way.
+
+The trick is that instead of dividing the pivot row by the pivot, every row
+gets multiplied by the pivot and then divided by the previous pivot, which
+always divides evenly. Every entry stays the determinant of some minor of the
+original matrix, so they never grow more than they have to.
+
+We start off with numpy int64 arrays, which are fast, and before each step we
+check that nothing could overflow. If something could we switch over to arrays
+of python integers (which can't overflow) and carry on from where we were.
+"""
+
+# the largest magnitude we let an intermediate result get to in int64
+INT64_LIMIT = 2**63 - 1
+
+# this builds the dense integer version of a sparse system
+def IntegerMatrix(system):
+    rows, cols, values = IntegerTriplets(system)
+    matrix = np.zeros(system.shape, dtype=np.int64)
+    big = False
+    for value in values:
+        if abs(value) > INT64_LIMIT:
+            big = True
+            break
+    if big:
+        matrix = matrix.astype(object)
+    for k in range(0, len(values)):
+        matrix[rows[k], cols[k]] += values[k]
+    return matrix
+
+"""
+This runs fraction-free Gauss-Jordan elimination on matrix (the matrix it
+hands back will hold python integers if int64 would have overflowed).
+For each pivot every other row (above and below) becomes
+    (pivot * row - row[col] * pivot_row) / previous_pivot
+When it is done each pivot row has the same value d in its pivot column and
+zeros in every other pivot column, so the reduced rows are d times the reduced
+row echelon form. It hands back the matrix, the list of pivot columns and d.
+"""
+def ReduceFractionFree(matrix):
+    num_rows, num_cols = matrix.shape
+    pivots = []
+    previous = 1
+    row = 0
+    for col in range(0, num_cols):
+        if row == num_rows:
+            break
+        non_zero = np.nonzero(matrix[row:, col])[0]
+        if len(non_zero) == 0:
+            continue
+        pivot_row = row + non_zero[0]
+        if pivot_row != row:
+            matrix[[row, pivot_row]] = matrix[[pivot_row, row]]
+        pivot = int(matrix[row, col])
+        if matrix.dtype != object:
+            # we check that neither product in the update can overflow
+            largest = int(np.abs(matrix).max())
+            largest_row = int(np.abs(matrix[row]).max())
+            largest_col = int(np.abs(matrix[:, col]).max())
+            if abs(pivot) * largest + largest_col * largest_row > INT64_LIMIT:
+                matrix = matrix.astype(object)
+        # now we update every other row, all at once
+        column = matrix[:, col].copy()
+        column[row] = 0
+        pivot_values = matrix[row].copy()
+        matrix = (matrix * pivot - np.outer(column, pivot_values)) // previous
+        matrix[row] = pivot_values
+        pivots.append(col)
+        previous = pivot
+        row += 1
+    return matrix, pivots, previous
+
+"""
+This finds a basis for the nullspace of a sparse system where every vector is
+a primitive integer vector (its entries have no common factor).
+
+Once the system is reduced, each free column gives a vector with d in its own
+position and the negative of each pivot row's entry in the position of that
+row's pivot. This is just d times the vector sympy would give us, so we divide
+out the gcd of the entries and flip the sign if we need to so the entry in the
+free column is positive.
+"""
+def FractionFreeNullspace(system):
+    num_rows, num_cols = system.shape
+    if num_cols == 0:
+        return []
+    matrix, pivots, d = ReduceFractionFree(IntegerMatrix(system))
+    pivot_set = set(pivots)
+    basis = []
+    for col in range(0, num_cols):
+        if col in pivot_set:
+            continue
+        vector = [0] * num_cols
+        vector[col] = d
+        for i in range(0, len(pivots)):
+            value = int(matrix[i, col])
+            if value:
+                vector[pivots[i]] = -value
+        divisor = 0
+        for value in vector:
+            divisor = gcd(divisor, value)
+        if d < 0:
+            divisor = -divisor
+        basis.append([value // divisor for value in vector])
+    return basis
@@ -1,7 +1,7 @@
 from math import pi, atan2, sin, cos, sqrt
 from pyx import path
 from issue import Issue
-from vertex import Index
+from vertex import PositionIndex
 from copy import copy
 from fractions import Fraction
 
@@ -378,7 +378,7 @@ class InteriorPointFinder:
         self.points = []
         self.interior = []
         self.used_positions = []
-        self.index = Index(2, 0, 2)
+        self.index = PositionIndex()
         self.slice = slice.norm_slice
 
     def GrowAbout(self, position):
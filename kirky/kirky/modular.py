@@ -0,0 +1,359 @@
+from fractions import Fraction
+from random import randrange
+import numpy as np
+from .issue import Issue
+from .sparse import exact
+
+"""
+This module finds nullspaces of our sparse systems using modular arithmetic.
+
+The idea is that instead of doing row reduction over the rationals (where
+every operation has to juggle ever-growing numerators, denominators and gcds)
+we do the row reduction modulo several primes. Every prime we use is below
+2^31 so that the product of any two residues fits comfortably inside a numpy
+int64, which lets us reduce whole rows at a time.
+
+Each prime gives us the reduced row echelon form of the system mod that prime.
+We stitch the residues of the entries we need back together with the Chinese
+Remainder Theorem and then recover the actual rational entries using rational
+reconstruction. Finally we check the vectors we found against the original
+system so that we know the answer is exact.
+"""
+
+# the largest residue product we allow is (2^31)^2 = 2^62 which keeps us
+# inside of int64
+PRIME_LIMIT = 2**31
+
+"""
+This is a deterministic Miller-Rabin test. The bases 2, 3, 5 and 7 are enough
+to get the right answer for every number below 3,215,031,751 which covers every
+prime we will ever use.
+"""
+def isPrime(n):
+    if n < 2:
+        return False
+    for p in (2, 3, 5, 7):
+        if n % p == 0:
+            return n == p
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in (2, 3, 5, 7):
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for i in range(0, s - 1):
+            x = pow(x, 2, n)
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+"""
+This gives back the count largest primes below limit (in decreasing order).
+We use the same primes every time so that the results are reproducible.
+"""
+def Primes(count, limit=PRIME_LIMIT):
+    primes = []
+    candidate = limit - 1
+    while len(primes) < count:
+        if isPrime(candidate):
+            primes.append(candidate)
+        candidate -= 1
+    return primes
+
+# this picks a random prime between limit/2 and limit
+def RandomPrime(limit=PRIME_LIMIT):
+    while True:
+        candidate = randrange(limit // 2, limit)
+        if isPrime(candidate):
+            return candidate
+
+def gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return abs(a)
+
+# the integer square root (rounded down) of a non-negative integer
+def isqrt(n):
+    if n < 2:
+        return n
+    x = 1 << ((n.bit_length() + 1) // 2)
+    while True:
+        y = (x + n // x) // 2
+        if y >= x:
+            return x
+        x = y
+
+"""
+Given a residue a modulo modulus, this finds the fraction n/d with
+|n|, d <= sqrt(modulus/2) that is congruent to a (if there is one). It does
+so by running the extended euclidean algorithm until the remainders drop below
+the bound. If no such fraction exists None is returned.
+"""
+def RationalReconstruction(a, modulus):
+    bound = isqrt(modulus // 2)
+    r0, r1 = modulus, a % modulus
+    s0, s1 = 0, 1
+    while r1 > bound:
+        q = r0 // r1
+        r0, r1 = r1, r0 - q * r1
+        s0, s1 = s1, s0 - q * s1
+    if s1 == 0 or abs(s1) > bound:
+        return None
+    if s1 < 0:
+        r1, s1 = -r1, -s1
+    if gcd(r1, s1) != 1:
+        return None
+    return exact(Fraction(r1, s1))
+
+"""
+This scales each row of a sparse system by the lowest common multiple of the
+denominators in it so that every entry is an integer. This doesn't change the
+nullspace at all. It hands back the (row, column, value) triplets.
+"""
+def IntegerTriplets(system):
+    rows = []
+    cols = []
+    values = []
+    for i in range(0, len(system.rows)):
+        row = system.rows[i]
+        scale = 1
+        for col in row:
+            denominator = Fraction(row[col]).denominator
+            scale = scale * denominator // gcd(scale, denominator)
+        for col in row:
+            rows.append(i)
+            cols.append(col)
+            values.append(int(row[col] * scale))
+    return rows, cols, values
+
+"""
+This builds the dense int64 version of the system modulo the prime p from the
+integer triplets found above
+"""
+def ModularMatrix(triplets, shape, p):
+    rows, cols, values = triplets
+    matrix = np.zeros(shape, dtype=np.int64)
+    if rows:
+        residues = np.array([value % p for value in values], dtype=np.int64)
+        # we use add.at in case any entry was listed twice
+        np.add.at(matrix, (np.array(rows), np.array(cols)), residues)
+        matrix %= p
+    return matrix
+
+"""
+This runs Gauss-Jordan elimination on matrix modulo the prime p. It works in
+place and gives back the list of pivot columns. When it is done the first
+len(pivots) rows of matrix hold the reduced row echelon form of the original
+(the rest are zero).
+
+Note that when we reach column c the pivot row we pick has nothing in any of
+the columns before c, so we only need to update the columns from c on.
+"""
+def ReduceModular(matrix, p):
+    num_rows, num_cols = matrix.shape
+    pivots = []
+    row = 0
+    for col in range(0, num_cols):
+        if row == num_rows:
+            break
+        non_zero = np.nonzero(matrix[row:, col])[0]
+        if len(non_zero) == 0:
+            continue
+        pivot_row = row + non_zero[0]
+        if pivot_row != row:
+            matrix[[row, pivot_row]] = matrix[[pivot_row, row]]
+        # we scale the row so that the pivot is one
+        inverse = pow(int(matrix[row, col]), p - 2, p)
+        matrix[row, col:] = (matrix[row, col:] * inverse) % p
+        # and clear the column out of every other row
+        column = matrix[:, col].copy()
+        column[row] = 0
+        others = np.nonzero(column)[0]
+        if len(others):
+            update = np.outer(column[others], matrix[row, col:]) % p
+            matrix[others, col:] = (matrix[others, col:] - update) % p
+        pivots.append(col)
+        row += 1
+    return pivots
+
+"""
+This finds the nullspace of a sparse system exactly using several primes.
+
+For each prime we find the reduced row echelon form modulo that prime. A prime
+can be 'unlucky', which shows up as fewer pivots or pivots further to the right
+than the true ones, so we only keep the residues of the primes that have the
+most pivots, furthest to the left. Of the reduced rows we only need the entries
+in the free (non-pivot) columns, and these get combined using the Chinese
+Remainder Theorem. After each prime we try to reconstruct the rational entries
+and, if that works, we build the nullspace vectors (just like sympy does from
+its reduced row echelon form) and check them against the original system.
+If they all check out we are done, otherwise we bring in another prime.
+
+The vectors are returned as lists of exact numbers in the same order sympy's
+nullspace would give them.
+"""
+def ModularNullspace(system, max_primes=64):
+    num_rows, num_cols = system.shape
+    if num_cols == 0:
+        return []
+    triplets = IntegerTriplets(system)
+    best_pivots = None
+    residues = None
+    modulus = 1
+    previous = None
+    for p in Primes(max_primes):
+        matrix = ModularMatrix(triplets, (num_rows, num_cols), p)
+        pivots = ReduceModular(matrix, p)
+        if best_pivots is not None:
+            if len(pivots) < len(best_pivots) or (len(pivots) == len(best_pivots) and pivots > best_pivots):
+                # this prime was unlucky so we skip it
+                continue
+            if pivots != best_pivots:
+                # all of the primes before this one were unlucky so we start over
+                residues = None
+                modulus = 1
+                previous = None
+        best_pivots = pivots
+        pivot_set = set(pivots)
+        free = [col for col in range(0, num_cols) if not col in pivot_set]
+        if not free:
+            # there is no nullspace at all
+            return []
+        current = matrix[:len(pivots)][:, free].astype(object)
+        # now we fold the new residues in using the Chinese Remainder Theorem
+        if residues is None:
+            residues = current
+        else:
+            inverse = pow(modulus % p, p - 2, p)
+            residues = residues + modulus * ((((current - residues) % p) * inverse) % p)
+        modulus *= p
+        # and we try to reconstruct the actual entries
+        entries = reconstruct(residues, modulus)
+        if entries is None or entries != previous:
+            # we wait until the reconstruction has settled down before we
+            # bother checking it against the system
+            previous = entries
+            continue
+        basis = nullspaceFromReduced(entries, pivots, free, num_cols)
+        verified = True
+        for vector in basis:
+            if not system.IsNullVector(vector):
+                verified = False
+                break
+        if verified:
+            return basis
+    raise Issue('could not find the nullspace with %s primes' % max_primes)
+
+# this runs rational reconstruction over every residue, giving back a list of
+# rows of exact numbers or None if any of the residues couldn't be reconstructed
+def reconstruct(residues, modulus):
+    entries = []
+    for i in range(0, residues.shape[0]):
+        row = []
+        for j in range(0, residues.shape[1]):
+            residue = residues[i, j]
+            if residue == 0:
+                row.append(0)
+                continue
+            value = RationalReconstruction(residue, modulus)
+            if value is None:
+                return None
+            row.append(value)
+        entries.append(row)
+    return entries
+
+"""
+Given the entries of the reduced rows in the free columns, this builds the
+nullspace basis: each free column gives a vector with a one in its own position
+and the negative of each pivot row's entry in the position of that row's pivot
+"""
+def nullspaceFromReduced(entries, pivots, free, num_cols):
+    basis = []
+    for j in range(0, len(free)):
+        vector = [0] * num_cols
+        vector[free[j]] = 1
+        for i in range(0, len(pivots)):
+            if entries[i][j]:
+                vector[pivots[i]] = -entries[i][j]
+        basis.append(vector)
+    return basis
+
+"""
+This finds the pivot columns of the reduced row echelon form of a sparse 
+system modulo the prime p, working right on the rows of the system (as 
+dictionaries of column -> residue) instead of a dense matrix. We take the 
+rows one at a time and keep clearing out the first entry of each using the 
+pivot row that starts in that column, until either nothing is left or it 
+starts in a column no pivot row does, in which case it becomes the pivot row 
+for that column. The pivot rows each start in a different column and between
+them they span the rows of the system, so the columns they start in are 
+exactly the pivot columns (and there are as many of them as the rank).
+
+How much clearing (and filling in) this takes depends a lot on the pivot 
+rows being short, so whenever a row starts in the same column as a pivot row
+we keep the shorter of the two as the pivot row, and we take the rows in 
+order of the column they start in. With that the pivot rows stay short, and 
+since the memory this takes only grows with their number of non-zero 
+entries it stays close to that of the system itself. It gives back the pivot
+columns in order.
+"""
+def PivotsModular(system, p):
+    pivot_rows = {}
+    rows = [residueRow(entries, p) for entries in system.rows]
+    rows.sort(key=lambda row: min(row) if row else 0)
+    for row in rows:
+        while row:
+            col = min(row)
+            pivot_row = pivot_rows.get(col)
+            if pivot_row is None or len(row) < len(pivot_row):
+                # this row becomes the pivot row, scaled so its pivot is one
+                inverse = pow(row[col], p - 2, p)
+                for c in row:
+                    row[c] = row[c] * inverse % p
+                pivot_rows[col] = row
+                if pivot_row is None:
+                    break
+                # and we carry on clearing the (longer) old pivot row instead
+                row, pivot_row = pivot_row, row
+            factor = row[col]
+            for c in pivot_row:
+                value = (row.get(c, 0) - factor * pivot_row[c]) % p
+                if value:
+                    row[c] = value
+                else:
+                    row.pop(c, None)
+    return sorted(pivot_rows)
+
+# this gives back a row of a system (a dictionary of column -> value) scaled
+# so that it is all integers and then taken modulo p, leaving out any entries
+# that become zero
+def residueRow(entries, p):
+    scale = 1
+    for col in entries:
+        denominator = Fraction(entries[col]).denominator
+        scale = scale * denominator // gcd(scale, denominator)
+    row = {}
+    for col in entries:
+        value = int(entries[col] * scale) % p
+        if value:
+            row[col] = value
+    return row
+
+"""
+This is a cheap check on whether a system has any nullspace at all. We find 
+the rank of the system modulo a random large prime (see PivotsModular). The rank modulo a prime 
+can never be bigger than the actual rank, so the number this gives back 
+(the number of columns minus that rank) is never smaller than the actual 
+dimension of the nullspace. In particular if this gives back zero we know for 
+certain there is no nullspace. If it is bigger than zero there almost 
+certainly is one (we would have to have been very unlucky with our prime).
+"""
+def ProbeNullity(system, p=None):
+    if p is None:
+        p = RandomPrime()
+    return system.num_cols - len(PivotsModular(system, p))
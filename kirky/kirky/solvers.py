@@ -0,0 +1,356 @@
+from fractions import Fraction
+import numpy as np
+from .issue import Issue
+from .sparse import SparseSystem, EchelonForm, exact
+from .modular import ModularNullspace, PivotsModular, RandomPrime, gcd
+from .fraction_free import FractionFreeNullspace
+
+"""
+This module holds the different ways we know how to find the nullspace of our
+linear systems, and a registry so that Kirchhoff can pick one by name.
+
+Each solver is a class with a Solve method that takes a SparseSystem and gives
+back a basis of its nullspace as a list of vectors (each a list of exact
+numbers with one entry per column). Kirchhoff makes its own solver object, so
+solvers are free to hold on to state between solves (like IncrementalSolver
+does).
+
+To plug in your own solver just write such a class and call RegisterSolver with
+the name you want to use for it.
+"""
+
+SOLVERS = {}
+
+def RegisterSolver(name, solver_class):
+    SOLVERS[name] = solver_class
+
+# this makes a new solver object from the name it was registered under
+def GetSolver(name):
+    if not name in SOLVERS:
+        raise Issue('unknown solver %s, choose one of %s' % (name, sorted(SOLVERS)))
+    return SOLVERS[name]()
+
+"""
+This does exact Gauss-Jordan elimination over the rationals right on the
+sparse system
+"""
+class SparseSolver:
+
+    def Solve(self, system):
+        return system.Nullspace()
+
+"""
+This does the elimination modulo several primes with numpy and recovers the
+exact answer from that (see modular.py)
+"""
+class ModularSolver:
+
+    def Solve(self, system):
+        return ModularNullspace(system)
+
+"""
+This builds the dense sympy matrix and uses its nullspace method
+"""
+class SympySolver:
+
+    def Solve(self, system):
+        basis = []
+        for column in system.ToMatrix().nullspace():
+            basis.append([exact(value) for value in column])
+        return basis
+
+"""
+This does the same elimination as SparseSolver but holds on to the reduced
+system, so that after a growth it only has to reduce what the growth added
+(see EchelonForm in sparse.py)
+"""
+class IncrementalSolver:
+
+    # this solver remembers the system it saw last, so it has to see the whole
+    # system every time
+    stateful = True
+
+    def __init__(self):
+        self.echelon = EchelonForm()
+
+    def Solve(self, system):
+        self.echelon.Extend(system)
+        return self.echelon.Nullspace()
+
+"""
+This does fraction-free elimination in integers and gives back a basis of
+primitive integer vectors, so the edge weights we lock in are integers (see
+fraction_free.py)
+"""
+class FractionFreeSolver:
+
+    def Solve(self, system):
+        return FractionFreeNullspace(system)
+
+"""
+This finds the nullspace in floating point using LAPACK's singular value
+decomposition, and then works out what the exact answer must have been. 
+This is fastest on smaller systems (up to a thousand or so columns), but the 
+decomposition is dense and takes time that grows with the cube of the number
+of columns, so on big blocks the sparse solver beats it (see 
+benchmark_solvers.py).
+
+The singular vectors belonging to the (numerically) zero singular values give
+us an orthonormal basis N of the nullspace, but that isn't something we can
+turn back into fractions. So we need the rows of N that belong to the free
+columns of the reduced row echelon form, which we get from the pivot columns 
+of the system modulo a random prime (see PivotsModular, these are the same 
+as the actual ones unless we are very unlucky with the prime). Then
+N * inverse(N[free rows]) is the basis with the identity in the free rows,
+which is exactly the basis sympy's nullspace gives. Most of its entries are 
+zero or whole numbers, which we just round off, and the rest are fractions 
+with small denominators that we recover with limit_denominator.
+
+Finally we check everything exactly. Each vector (kept as a dictionary of 
+its non-zero entries until the very end) has to be in the nullspace of the 
+sparse system, and the number of vectors has to match the number of free 
+columns modulo the prime (which can't be smaller than the actual dimension 
+of the nullspace, see ProbeNullity). If anything doesn't check out we fall 
+back to an exact solver.
+"""
+class SVDSolver:
+
+    def __init__(self, fallback='modular', max_denominator=10**6, tolerance=1e-9):
+        self.fallback = fallback
+        self.max_denominator = max_denominator
+        self.tolerance = tolerance
+
+    def Solve(self, system):
+        basis = self.svdNullspace(system)
+        if basis is None:
+            print('-->could not verify the svd nullspace, falling back to %s' % self.fallback)
+            return GetSolver(self.fallback).Solve(system)
+        return basis
+
+    def svdNullspace(self, system):
+        num_rows, num_cols = system.shape
+        if num_cols == 0:
+            return []
+        matrix = np.zeros((num_rows, num_cols))
+        rows, cols, values = system.Triplets()
+        if values:
+            matrix[rows, cols] = [float(value) for value in values]
+        if num_rows == 0:
+            rank = 0
+            null_basis = np.identity(num_cols)
+        else:
+            # we only need the right singular vectors, and we only need more 
+            # of them than there are rows when there are fewer rows than 
+            # columns (in which case U is just rows by rows anyway)
+            try:
+                u, s, vh = np.linalg.svd(matrix, full_matrices=num_rows < num_cols)
+            except np.linalg.LinAlgError:
+                return None
+            rank = 0
+            if len(s) and s[0] > 0:
+                tolerance = max(num_rows, num_cols) * np.finfo(float).eps * s[0]
+                rank = int((s > tolerance).sum())
+            null_basis = vh[rank:].T
+        nullity = num_cols - rank
+        # we make sure the dimension is right
+        pivots = set(PivotsModular(system, RandomPrime()))
+        free = [col for col in range(0, num_cols) if not col in pivots]
+        if len(free) != nullity:
+            return None
+        if nullity == 0:
+            return []
+        try:
+            null_basis = null_basis.dot(np.linalg.inv(null_basis[free]))
+        except np.linalg.LinAlgError:
+            return None
+        null_basis[free] = np.identity(nullity)
+        # now we round off everything that is (nearly) a whole number, and 
+        # only turn what is left into fractions the slow way. The same few 
+        # fractions turn up over and over so we remember the ones we've found
+        rounded = np.rint(null_basis)
+        whole = np.abs(null_basis - rounded) <= self.tolerance
+        fractions = {}
+        columns = system.ColumnEntries()
+        basis = []
+        for k in range(0, nullity):
+            vector = {}
+            for i in np.nonzero(whole[:, k] & (rounded[:, k] != 0))[0].tolist():
+                vector[i] = int(rounded[i, k])
+            scale = 1
+            for i in np.nonzero(~whole[:, k])[0].tolist():
+                key = round(null_basis[i, k], 9)
+                if not key in fractions:
+                    fractions[key] = Fraction(null_basis[i, k]).limit_denominator(self.max_denominator)
+                vector[i] = fractions[key]
+                scale = scale * vector[i].denominator // gcd(scale, vector[i].denominator)
+            # we check a whole number multiple of the vector, which saves us
+            # from doing the check in fractions
+            scaled = {}
+            for i in vector:
+                scaled[i] = int(vector[i] * scale)
+            if not system.IsSparseNullVector(scaled, columns):
+                return None
+            dense = [0] * num_cols
+            for i in vector:
+                dense[i] = exact(vector[i])
+            basis.append(dense)
+        return basis
+
+"""
+These turn a SparseSystem into a compact form made of nothing but lists of 
+python integers (the CSR arrays with each entry split into its numerator and 
+denominator) and back again. This is what we send to other processes, since 
+it is far cheaper to pickle than the system itself (let alone a sympy matrix).
+"""
+def PackSystem(system):
+    indptr, indices, values = system.CSR()
+    numerators = []
+    denominators = []
+    for value in values:
+        value = Fraction(value)
+        numerators.append(value.numerator)
+        denominators.append(value.denominator)
+    return (system.num_cols, indptr, indices, numerators, denominators)
+
+def UnpackSystem(packed):
+    num_cols, indptr, indices, numerators, denominators = packed
+    system = SparseSystem(num_cols)
+    for i in range(0, len(indptr) - 1):
+        entries = {}
+        for k in range(indptr[i], indptr[i + 1]):
+            entries[indices[k]] = exact(Fraction(numerators[k], denominators[k]))
+        system.rows.append(entries)
+    return system
+
+"""
+This is what each process runs: it unpacks the system, solves it with a fresh
+solver of the given name and packs the basis back up as (numerator, 
+denominator) pairs. It has to live at the top of the module so that it can be 
+pickled. Note that the solver has to be registered in the other processes too,
+which the built in ones always are.
+"""
+def solvePacked(job):
+    name, packed = job
+    basis = []
+    for vector in GetSolver(name).Solve(UnpackSystem(packed)):
+        pairs = []
+        for value in vector:
+            value = Fraction(value)
+            pairs.append((value.numerator, value.denominator))
+        basis.append(pairs)
+    return basis
+
+# this solves a whole batch of packed jobs in one go, so that lots of small 
+# components only cost a single trip to another process between them
+def solveBatch(jobs):
+    return [solvePacked(job) for job in jobs]
+
+"""
+This splits a system up into its connected components (see 
+SparseSystem.Components) and solves each one separately with a fresh solver of
+the given name. Only the biggest component has to pay the full price of the 
+elimination, and the small ones are almost free.
+
+If workers is more than one the components get split up into batches (see 
+batches) which get handed out to a pool of that many processes. Either way every component goes through the same packing and 
+unpacking (see solvePacked) and the results are put back together in the same 
+order, so the answer is exactly the same however many workers there are. If 
+concurrent.futures isn't around (it is only a backport on python 2) we just 
+solve everything in this process.
+
+The nullspace of the whole system is then just all of the components' 
+nullspace vectors, put back into the right columns, along with a unit vector
+for each column that isn't in any row. We order them by the position of their
+last non-zero entry, which for the basis sympy gives is the free column the 
+vector belongs to, so we get back exactly what solving the whole thing would 
+have given.
+"""
+class ComponentSolver:
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+
+    def Solve(self, system):
+        num_cols = system.num_cols
+        components = system.Components()
+        largest = (0, 0)
+        keyed = []
+        constrained = []
+        jobs = []
+        for rows, cols in components:
+            if not rows:
+                # these columns aren't constrained at all
+                for col in cols:
+                    vector = [0] * num_cols
+                    vector[col] = 1
+                    keyed.append((col, vector))
+                continue
+            if len(rows) * len(cols) > largest[0] * largest[1]:
+                largest = (len(rows), len(cols))
+            constrained.append(cols)
+            jobs.append((self.name, PackSystem(system.SubSystem(rows, cols))))
+        print('-->split linear system into %s components (largest is %s by %s)' % (len(components), largest[0], largest[1]))
+        results = self.solveAll(jobs)
+        for k in range(0, len(jobs)):
+            cols = constrained[k]
+            for sub_vector in results[k]:
+                vector = [0] * num_cols
+                last = 0
+                for i in range(0, len(cols)):
+                    numerator, denominator = sub_vector[i]
+                    if numerator:
+                        vector[cols[i]] = exact(Fraction(numerator, denominator))
+                        last = cols[i]
+                keyed.append((last, vector))
+        keyed.sort(key=lambda pair: pair[0])
+        return [pair[1] for pair in keyed]
+
+    # this solves each of the packed systems, in a pool of processes if we 
+    # were asked to, giving back the results in the same order as the jobs
+    def solveAll(self, jobs):
+        if self.workers > 1 and len(jobs) > 1:
+            try:
+                from concurrent.futures import ProcessPoolExecutor
+            except ImportError:
+                print('-->concurrent.futures is not available, solving in one process')
+            else:
+                batches = self.batches(jobs)
+                print('-->solving %s components in %s batches with %s processes' % (len(jobs), len(batches), self.workers))
+                executor = ProcessPoolExecutor(max_workers=self.workers)
+                try:
+                    solved = list(executor.map(solveBatch, [[jobs[k] for k in batch] for batch in batches]))
+                finally:
+                    executor.shutdown()
+                results = [None] * len(jobs)
+                for b in range(0, len(batches)):
+                    for i in range(0, len(batches[b])):
+                        results[batches[b][i]] = solved[b][i]
+                return results
+        return [solvePacked(job) for job in jobs]
+
+    """
+    This splits the jobs up into about four batches for each process (so that
+    a process that finishes early can pick up another), giving back the 
+    indexes of the jobs in each batch. We want the batches to take about the 
+    same time, so we go through the jobs from the biggest (by number of 
+    non-zero entries) down, putting each into the batch with the least in it
+    so far.
+    """
+    def batches(self, jobs):
+        count = min(len(jobs), 4 * self.workers)
+        batches = [[] for b in range(0, count)]
+        loads = [0] * count
+        sizes = [len(job[1][2]) + 1 for job in jobs]
+        for k in sorted(range(0, len(jobs)), key=lambda k: -sizes[k]):
+            smallest = loads.index(min(loads))
+            batches[smallest].append(k)
+            loads[smallest] += sizes[k]
+        return [sorted(batch) for batch in batches if batch]
+
+RegisterSolver('sparse', SparseSolver)
+RegisterSolver('modular', ModularSolver)
+RegisterSolver('sympy', SympySolver)
+RegisterSolver('incremental', IncrementalSolver)
+RegisterSolver('bareiss', FractionFreeSolver)
+RegisterSolver('svd', SVDSolver)
@@ -0,0 +1,469 @@
+from fractions import Fraction
+from heapq import heapify, heappop, heappush
+from sympy import Matrix
+
+"""
+This turns any of the numbers that show up in our conditions (python ints,
+Fractions or sympy Integers and Rationals) into an exact python number. We
+keep integers as ints because int arithmetic is a good deal cheaper than
+Fraction arithmetic and almost every entry in our systems is an integer.
+"""
+def exact(value):
+    if isinstance(value, int):
+        return value
+    if hasattr(value, 'p') and hasattr(value, 'q'):
+        # this is a sympy Rational (or Integer)
+        value = Fraction(int(value.p), int(value.q))
+    else:
+        value = Fraction(value)
+    if value.denominator == 1:
+        return int(value.numerator)
+    return value
+
+"""
+This takes a list of vectors (each a list of exact numbers) and hands them
+back as sympy column matrices. This is the format the rest of kirky expects
+a nullspace to come in (it's what sympy's nullspace gives back)
+"""
+def ToColumns(vectors):
+    columns = []
+    for vector in vectors:
+        columns.append(Matrix(len(vector), 1, vector))
+    return columns
+
+"""
+The linear systems we generate have only a handful of non-zero entries in
+each row (one for each edge weight touching a vertex cut) but the number of
+columns grows with the number of edges in the block. So instead of holding a
+dense matrix we hold each row as a dictionary mapping column index to its
+(exact) entry, leaving out all of the zeros.
+
+Rows and columns can be added one after another. If you need the system in
+another form you can ask for its triplets, its compressed sparse row arrays or,
+if you really must, a dense sympy Matrix.
+"""
+class SparseSystem:
+
+    def __init__(self, num_cols=0):
+        # each row is a dictionary of column index -> non-zero entry
+        self.rows = []
+        self.num_cols = num_cols
+        # this holds, for each row replaced since the last call to 
+        # TakeModified, what the row was before it was first replaced
+        self.modified = {}
+
+    @property
+    def shape(self):
+        return (len(self.rows), self.num_cols)
+
+    # this returns the number of non-zero entries in the system
+    def NumNonZero(self):
+        count = 0
+        for row in self.rows:
+            count += len(row)
+        return count
+
+    """
+    This adds a new row to the bottom of the system. entries should be a
+    dictionary mapping column index to value. Zeros are dropped and the index
+    of the new row is returned.
+    """
+    def AddRow(self, entries):
+        row = {}
+        for col in entries:
+            value = exact(entries[col])
+            if value:
+                row[col] = value
+        self.rows.append(row)
+        return len(self.rows) - 1
+
+    # this replaces the entries of an existing row
+    def SetRow(self, index, entries):
+        row = {}
+        for col in entries:
+            value = exact(entries[col])
+            if value:
+                row[col] = value
+        if not index in self.modified:
+            self.modified[index] = self.rows[index]
+        self.rows[index] = row
+
+    # this hands back the rows replaced since the last time this was called 
+    # (mapped to what they were before) and starts keeping track afresh
+    def TakeModified(self):
+        modified = self.modified
+        self.modified = {}
+        return modified
+
+    def AddColumns(self, count):
+        self.num_cols += count
+
+    """
+    This gives back the system as three lists (rows, columns, values) where
+    the kth non-zero entry sits at (rows[k], columns[k]) with value values[k]
+    """
+    def Triplets(self):
+        rows = []
+        cols = []
+        values = []
+        for i in range(0, len(self.rows)):
+            for col in sorted(self.rows[i]):
+                rows.append(i)
+                cols.append(col)
+                values.append(self.rows[i][col])
+        return rows, cols, values
+
+    """
+    This gives back the system in compressed sparse row form: the entries of
+    row i are values[indptr[i]:indptr[i+1]] and they sit in the columns
+    indices[indptr[i]:indptr[i+1]]
+    """
+    def CSR(self):
+        indptr = [0]
+        indices = []
+        values = []
+        for row in self.rows:
+            for col in sorted(row):
+                indices.append(col)
+                values.append(row[col])
+            indptr.append(len(indices))
+        return indptr, indices, values
+
+    # this builds the dense sympy version of the system (only use this when
+    # you really need it, it's huge)
+    def ToMatrix(self):
+        num_rows, num_cols = self.shape
+        matrix = Matrix(num_rows, num_cols, [0] * (num_rows * num_cols))
+        for i in range(0, num_rows):
+            for col in self.rows[i]:
+                matrix[i, col] = self.rows[i][col]
+        return matrix
+
+    # this multiplies the system by a vector (a list with one entry per column)
+    def Multiply(self, vector):
+        result = []
+        for row in self.rows:
+            total = 0
+            for col in row:
+                total += row[col] * vector[col]
+            result.append(total)
+        return result
+
+    # this lets us know if a vector is in the nullspace of the system
+    def IsNullVector(self, vector):
+        for value in self.Multiply(vector):
+            if value != 0:
+                return False
+        return True
+
+    # this gives back, for each column, the list of (row, value) pairs of the
+    # non-zero entries in that column
+    def ColumnEntries(self):
+        columns = [[] for col in range(0, self.num_cols)]
+        for i in range(0, len(self.rows)):
+            for col in self.rows[i]:
+                columns[col].append((i, self.rows[i][col]))
+        return columns
+
+    """
+    This does the same as IsNullVector for a vector given as a dictionary of 
+    its non-zero entries (column -> value). We only add up the rows that touch
+    those columns, which we find in columns (what ColumnEntries gives back), 
+    so vectors with few non-zero entries are cheap to check.
+    """
+    def IsSparseNullVector(self, vector, columns):
+        totals = {}
+        for col in vector:
+            for i, value in columns[col]:
+                totals[i] = totals.get(i, 0) + value * vector[col]
+        for total in totals.values():
+            if total != 0:
+                return False
+        return True
+
+    """
+    Edge weights only interact with one another through the vertex cuts they 
+    share, so the system often falls apart into pieces that have nothing to do
+    with one another. This finds those pieces: the connected components of the
+    graph where each column is joined to every other column it shares a row 
+    with. It gives back a list of (rows, columns) pairs, each sorted, ordered 
+    by their first column. A column that isn't in any row ends up in a 
+    component of its own with no rows. Rows with no entries aren't in any
+    component (they don't constrain anything).
+    """
+    def Components(self):
+        # we use union-find over the columns
+        parents = list(range(0, self.num_cols))
+        def find(col):
+            root = col
+            while parents[root] != root:
+                root = parents[root]
+            # and we shorten the path for next time
+            while parents[col] != root:
+                parents[col], col = root, parents[col]
+            return root
+        for row in self.rows:
+            cols = list(row)
+            if not cols:
+                continue
+            root = find(cols[0])
+            for col in cols[1:]:
+                other = find(col)
+                if other != root:
+                    parents[other] = root
+        components = {}
+        for col in range(0, self.num_cols):
+            root = find(col)
+            if not root in components:
+                components[root] = ([], [])
+            components[root][1].append(col)
+        for i in range(0, len(self.rows)):
+            if self.rows[i]:
+                for col in self.rows[i]:
+                    components[find(col)][0].append(i)
+                    break
+        return sorted(components.values(), key=lambda component: component[1][0])
+
+    """
+    This builds the system made up of just the given rows and columns (the 
+    columns get renumbered from zero in the order they are given). The rows 
+    shouldn't have entries outside of those columns.
+    """
+    def SubSystem(self, rows, cols):
+        positions = {}
+        for i in range(0, len(cols)):
+            positions[cols[i]] = i
+        system = SparseSystem(len(cols))
+        for index in rows:
+            row = self.rows[index]
+            entries = {}
+            for col in row:
+                entries[positions[col]] = row[col]
+            system.rows.append(entries)
+        return system
+
+    """
+    This finds a basis for the nullspace of the system using exact Gauss-Jordan
+    elimination over the rationals done directly on the sparse rows (see 
+    EchelonForm below). The basis is exactly the one (in the same order) that 
+    sympy's nullspace would give us.
+
+    The vectors are returned as lists of exact numbers.
+    """
+    def Nullspace(self):
+        echelon = EchelonForm(record=False)
+        echelon.Extend(self)
+        return echelon.Nullspace()
+
+"""
+This holds the reduced row echelon form of a sparse system and, because our
+systems only ever grow, it can be brought up to date with the rows and columns
+a growth added without starting the elimination over.
+
+The elimination itself is exact Gauss-Jordan elimination on the sparse rows.
+We run through the columns in order. For each one we look for a row that
+hasn't been used as a pivot yet and has a non-zero entry in that column (we
+take the shortest one we can find to keep the fill-in down). We scale it so
+the entry is one and then subtract it from every other row with an entry in
+that column. To find those rows quickly we keep, for every column, the set
+of rows that have a non-zero entry there.
+
+Now when the system grows three things can happen:
+    * new columns get added on the right
+    * existing rows pick up entries in those new columns
+    * new rows get added at the bottom
+Because of the first two, the reduced rows we have are missing whatever the 
+row operations we already did would have done to the new entries. So we keep 
+a log of every row operation we do, and replay it over just the new entries 
+of the rows that changed (which is cheap, most operations don't touch them). 
+The new rows get reduced by the pivot rows we already have, and then we carry 
+on the elimination from the columns that still have entries in non-pivot 
+rows. Since the pivots of the old columns can't change, we end up with exactly
+the reduced row echelon form we would have gotten starting from scratch.
+
+If an existing row changes in one of the old columns we can't do this and 
+just start over.
+"""
+class EchelonForm:
+
+    def __init__(self, record=True):
+        # if record is False we don't keep the log of row operations, which 
+        # saves memory when we only ever need to eliminate once
+        self.record = record
+        self.reset()
+
+    def reset(self):
+        self.system = None
+        # the reduced rows (one for each row of the system, in the same order)
+        self.rows = []
+        # this maps each column to the rows with a non-zero entry in it
+        self.col_rows = {}
+        # this maps each pivot column to its row and each pivot row to its column
+        self.pivots = {}
+        self.row_pivots = {}
+        self.num_cols = 0
+        # each entry is (target, source, factor). If source is None the target
+        # row was multiplied by factor, otherwise factor times the source row 
+        # was subtracted from the target row
+        self.log = []
+
+    def Rank(self):
+        return len(self.pivots)
+
+    """
+    This brings the echelon form up to date with system. The first time this 
+    is called it just reduces the whole system.
+    """
+    def Extend(self, system):
+        if system is not self.system:
+            self.reset()
+            self.system = system
+            if self.record:
+                # anything that changed before now is already in the rows
+                system.TakeModified()
+        old_rows = len(self.rows)
+        old_cols = self.num_cols
+        # first we find the new entries of the rows that changed
+        block = {}
+        if self.record:
+            modified = system.TakeModified()
+            for index in modified:
+                if index >= old_rows:
+                    continue
+                old = modified[index]
+                new = system.rows[index]
+                delta = {}
+                for col in new:
+                    value = new[col] - old.get(col, 0)
+                    if value:
+                        delta[col] = value
+                for col in old:
+                    if not col in new:
+                        delta[col] = -old[col]
+                for col in delta:
+                    if col < old_cols:
+                        # this isn't just growth so we have to start over
+                        self.reset()
+                        return self.Extend(system)
+                if delta:
+                    block[index] = delta
+        self.num_cols = system.num_cols
+        # then we replay everything we've done over those new entries
+        if block:
+            for target, source, factor in self.log:
+                if source is None:
+                    if target in block:
+                        entries = block[target]
+                        for col in entries:
+                            entries[col] = exact(entries[col] * factor)
+                    continue
+                entries = block.get(source)
+                if not entries:
+                    continue
+                if not target in block:
+                    block[target] = {}
+                target_entries = block[target]
+                for col in entries:
+                    value = target_entries.get(col, 0) - factor * entries[col]
+                    if value:
+                        target_entries[col] = value
+                    elif col in target_entries:
+                        del target_entries[col]
+            # and now we put them into the reduced rows
+            for index in block:
+                entries = block[index]
+                for col in entries:
+                    self.rows[index][col] = entries[col]
+                    self.addToColumn(col, index)
+        # next we bring in the new rows, reducing them by the pivots we have
+        for index in range(old_rows, len(system.rows)):
+            row = dict(system.rows[index])
+            self.rows.append(row)
+            for col in row:
+                self.addToColumn(col, index)
+            for col in [col for col in row if col in self.pivots]:
+                self.subtract(index, self.pivots[col], row[col])
+        # and finally we carry on the elimination. The columns left to look at
+        # are the ones with entries in rows that aren't pivot rows
+        queue = set()
+        for index in range(0, len(self.rows)):
+            if index in self.row_pivots:
+                continue
+            for col in self.rows[index]:
+                queue.add(col)
+        heap = list(queue)
+        heapify(heap)
+        while heap:
+            col = heappop(heap)
+            pivot_row = None
+            for index in self.col_rows.get(col, ()):
+                if index in self.row_pivots:
+                    continue
+                if pivot_row is None or len(self.rows[index]) < len(self.rows[pivot_row]):
+                    pivot_row = index
+            if pivot_row is None:
+                continue
+            # we scale the pivot row so that its entry in this column is one
+            prow = self.rows[pivot_row]
+            if prow[col] != 1:
+                self.scale(pivot_row, 1 / Fraction(prow[col]))
+            # and now we clear this column out of every other row
+            for index in list(self.col_rows[col]):
+                if index != pivot_row:
+                    self.subtract(index, pivot_row, self.rows[index][col])
+            self.pivots[col] = pivot_row
+            self.row_pivots[pivot_row] = col
+            # any fill-in in the non-pivot rows came from the pivot row so its
+            # columns are the only new ones we might need to look at
+            for key in prow:
+                if key > col and not key in queue:
+                    queue.add(key)
+                    heappush(heap, key)
+
+    # this notes that row index has a non-zero entry in col
+    def addToColumn(self, col, index):
+        if not col in self.col_rows:
+            self.col_rows[col] = set()
+        self.col_rows[col].add(index)
+
+    # this multiplies a row by factor
+    def scale(self, target, factor):
+        row = self.rows[target]
+        for key in row:
+            row[key] = exact(row[key] * factor)
+        if self.record:
+            self.log.append((target, None, factor))
+
+    # this subtracts factor times the source row from the target row
+    def subtract(self, target, source, factor):
+        row = self.rows[target]
+        source_row = self.rows[source]
+        for key in source_row:
+            value = row.get(key, 0) - factor * source_row[key]
+            if value:
+                if not key in row:
+                    self.addToColumn(key, target)
+                row[key] = value
+            elif key in row:
+                del row[key]
+                self.col_rows[key].discard(target)
+        if self.record:
+            self.log.append((target, source, factor))
+
+    """
+    This reads the nullspace basis off of the reduced rows. Each column that 
+    didn't get a pivot gives us a basis vector: a one in that column's 
+    position, and in the position of each pivot column the negative of the 
+    pivot row's entry in the free column. 
+    """
+    def Nullspace(self):
+        basis = []
+        for col in range(0, self.num_cols):
+            if col in self.pivots:
+                continue
+            vector = [0] * self.num_cols
+            vector[col] = 1
+            for index in self.col_rows.get(col, ()):
+                vector[self.row_pivots[index]] = -self.rows[index][col]
+            basis.append(vector)
+        return basis
@@ -1,3 +1,5 @@
+import numpy as np
+from bisect import bisect_right
 from issue import Issue
 
 """
@@ -16,28 +18,40 @@ the child will lock to zero.
 And that's essentially all there is to nodes
 """
 
-class Node:
+# nodes that don't have any children or parents yet all share this instead of
+# each having an empty container of their own
+EMPTY = ()
+
+"""
+Blocks have a huge number of nodes (one for every entry of every vertex cut 
+and one for every edge weight) so we keep nodes as small as we can. They use 
+__slots__ so they don't each carry a dictionary around, and their groups are 
+kept in lists indexed by key (the keys are just 0, 1, 2, ... and almost every
+node has a single parent group, or none at all). Until a node gets a parent 
+group or a child it shares the same empty tuple with every other node.
+"""
+class Node(object):
+
+    __slots__ = ('kind', 'children', 'parent_groups', 'held', 'serial', 'web', 'id', 'weight_id')
     
     def __init__(self, web, id):
         self.kind = None
         # children will be held under the key they assign to this parent
-        # this is so that when the parents let the children know they have 
-        # locked, the children can quickly assign the lock to the appropriate
-        # group
-        self.children = {}
-        # parents will be held in groups each element within a group will 
-        # be a tuple with the parent node as the first element and a multiplier
-        # as the second
-        self.parent_groups = {}
-        # these will let us know how many parents have 
-        # locked in a group
-        self.parent_group_locks = {}
-        # this just holds the next key we will use for a parent group
-        self.next_key = 0
-        
-        self.value = None
-        
-        self.lock = False
+        # (children[key] is the list of children that have this node in their 
+        # parent group key) this is so that when the parents let the children 
+        # know they have locked, the children can quickly assign the lock to 
+        # the appropriate group
+        self.children = EMPTY
+        # parents will be held in groups (parent_groups[key] is the group with
+        # that key) each element within a group will be a tuple with the 
+        # parent node as the first element and a multiplier as the second
+        self.parent_groups = EMPTY
+        # when a node locks it gets the next serial number from the web, and 
+        # it stays locked for as long as the web counts that serial as live 
+        # (see Web.Checkpoint). Until it first locks it has no serial
+        self.serial = None
+        # and this is the value it locked to
+        self.held = None
         
         # this is the web the node is attached to
         self.web = web
@@ -49,80 +63,85 @@ class Node:
         # parent groups are how we show that several nodes should when combined 
         # in a particular way equal this node
         # we create the new parent group
-        key = self.next_key
-        self.parent_groups[key] = []
-        self.parent_group_locks[key] = 0
-        self.next_key += 1
+        if self.parent_groups is EMPTY:
+            self.parent_groups = []
+        key = len(self.parent_groups)
+        self.parent_groups.append([])
         # and then add in the parents
         for parent_tuple in parent_tuples:
-            self.parent_groups.append(parent_tuple)
+            self.parent_groups[key].append(parent_tuple)
             # and this allows the parent to add the child 
             # under the appropriate group number
             parent_tuple[0].addChild(key, self)
+        self.web.touch(self)
         return key
             
     def AddParent(self, key, parent_tuple):
         self.parent_groups[key].append(parent_tuple)
         parent_tuple[0].addChild(key, self)
+        # we let the web know this node's parents have changed, if anyone is 
+        # keeping track
+        if self.web.changed is not None:
+            self.web.changed.append(self)
+        self.web.touch(self)
             
     def addChild(self, key, child):
-        if not key in self.children:
-            self.children[key] = []
-        self.children[key].append(child)
+        if self.children is EMPTY:
+            self.children = []
+        children = self.children
+        while len(children) <= key:
+            children.append(EMPTY)
+        if children[key] is EMPTY:
+            children[key] = []
+        children[key].append(child)
     
+    @property
+    def lock(self):
+        serial = self.serial
+        # almost every lock is in the current era so we check that first
+        return serial is not None and (serial >= self.web.era_start or self.web.isLive(serial))
+
+    # the value the node is locked to (zero once it has been unlocked, and 
+    # None if it has never been locked)
+    @property
+    def value(self):
+        if self.serial is None:
+            return None
+        if self.web.isLive(self.serial):
+            return self.held
+        return 0
+
+    # how many of the parents in each group are locked
+    @property
+    def parent_group_locks(self):
+        counts = []
+        for group in self.parent_groups:
+            counts.append(len([parent for parent, multiplier in group if parent.lock]))
+        return counts
+
+    # this is the value the parents in a group add up to (once they are all 
+    # locked)
+    def groupValue(self, key):
+        value = 0
+        for parent_tuple in self.parent_groups[key]:
+            value += parent_tuple[1] * parent_tuple[0].held
+        return value
+
     # this is what gets called when all parents have locked and now a child
     # should as well
     def parentLock(self, key):
-        # first we generate the value that this child will attempt to lock 
-        # to, because we need for both conditional statements to follow
-        value = 0
-        for parent_tuple in self.parent_groups[key]:
-            value += parent_tuple[1] * parent_tuple[0].value
-        # now that we have our value we see if this node is already locked 
-        # we can attempt a lock
-        self.Lock(value)
-    
-    # this updates the lock counts on the children and triggers a lock where 
-    # necessary (avoiding a lock trigger on id_to_ignore)        
-    def updateLocksOnChildren(self):
-        for key in self.children:
-            for child in self.children[key]:
-                child.parent_group_locks[key] += 1
-                # then we need to see if a lock is triggered on the children
-                if child.parent_group_locks[key] == len(child.parent_groups[key]):
-                    child.parentLock(key)
-    
-    # this is how you manually lock a node            
+        self.Lock(self.groupValue(key))
+    
+    # this is how you manually lock a node (the web does the actual work, 
+    # see Web.propagate)
     def Lock(self, value):
-        # first we check to make sure that this isn't already locked
-        if not self.lock:
-            self.value = value
-            self.lock = True
-            # we let the web node a lock has happened
-            self.web.addLock(self, value)
-            # we update lock information on child nodes
-            self.updateLocksOnChildren()
-        else:
-            # if it is already locked we check to see that the value we are 
-            # trying to lock to is the node's own value
-            if self.value == value:
-                return 
-            else:
-                # if it isn't we send invoke a method on the web
-                self.web.HandleDoubleLock(self, value)
+        self.web.propagate(self, value)
             
+    # this unlocks just this node (a serial that is never live). Normally you
+    # want the web to do the unlocking (see Web.RollBack and Web.Restore)
     def Unlock(self):
         if self.lock:
-            # this is overly simple because most of the unlocking procedure 
-            # will be handled by the web this node is in
-            self.lock = False
-            self.value = 0
-            # and now we need to decrement the lock counts on this node's children
-            # note that the actual unlocking of these children will be handled by 
-            # the web
-            for key in self.children:
-                for child in self.children[key]:
-                    child.parent_group_locks[key] -= 1
+            self.serial = -1
         
 """
 This class hold collective state about nodes and captures lock state 
@@ -135,10 +154,17 @@ class Web:
         # this is a list containing the locks that were specifically 
         # commanded. What is actually contained in each entry
         # is a tuple, the first entry is the node that was locked by 
-        # command, the second entry is the list of locks that occured
-        # after that lock took place
+        # command, the second entry is the serial it locked with (every lock 
+        # that happened because of it comes after that)
         # this data will allow us to roll back to the last actuated lock
         self.locks = []
+        # every lock gets the next serial number, and the serials that are 
+        # live (see Checkpoint) are the ones from era_start on, along with 
+        # those in [era_starts[i], era_ends[i]) for each of the earlier eras
+        self.tick = 0
+        self.era_start = 0
+        self.era_starts = []
+        self.era_ends = []
         # this is a list that holds all of the nodes that got a double 
         # lock condition on them
         self.errors = []
@@ -147,6 +173,14 @@ class Web:
         # for example when I am creating edges will simply be lost as they 
         # are found to be unneeded
         self.nodes = [] # this should be cleaned up
+        # this holds the nodes that have been given new parents since the 
+        # last time someone asked (see TakeChanged). It is None until someone
+        # first asks, so that we don't keep every change when nobody wants them
+        self.changed = None
+        # this is the web laid out in arrays (see Compile), if it has been, 
+        # along with the nodes whose groups have changed since
+        self.compiled = None
+        self.touched = []
         
     # this just creates a new node, assigned to this web, with the appropriate
     # new id
@@ -159,6 +193,39 @@ class Web:
     def RemoveNode(self):
         self.nodes.pop(-1)
         self.next_id -= 1
+        # if the arrays have this node in them they have to be made afresh
+        if self.compiled is not None and self.compiled.num_nodes > self.next_id:
+            self.compiled = None
+    
+    # nodes let us know through this when their groups change, so that we 
+    # can bring the arrays up to date
+    def touch(self, node):
+        if self.compiled is not None:
+            self.touched.append(node)
+
+    """
+    This gives back the web laid out in arrays (see CompiledWeb), making them
+    or bringing them up to date first if it needs to. The nodes and their 
+    groups are still there as they always were, the arrays are just another 
+    way of looking at them that lets us work on all of them at once.
+    """
+    def Compile(self):
+        if self.compiled is None:
+            self.compiled = CompiledWeb(self)
+            self.touched = []
+        else:
+            touched = self.touched
+            self.touched = []
+            self.compiled.update(touched)
+        return self.compiled
+    
+    # this hands back the nodes that have been given new parents since the last
+    # time this was called and starts keeping track afresh. If we weren't 
+    # keeping track (or lost track, see forgetChanged) it hands back None
+    def TakeChanged(self):
+        changed = self.changed
+        self.changed = []
+        return changed
     
     # this is how we should call a lock on a node. Calling it in this way 
     # allows the web to keep enough state so that it can rollback in the 
@@ -168,27 +235,185 @@ class Web:
             raise Issue('cannot lock an already locked node from web command!')
         # we create a new entry for this lock and the locks that happen as a 
         # result
-        new_lock_data = (node, [])
+        new_lock_data = (node, self.tick)
         self.locks.append(new_lock_data)
         # and now we initiate the lock
         node.Lock(value)
         
-    def addLock(self, node, value):
-        # we add a new node into the current_lock data
-        self.locks[-1][1].append(node)
+    # this locks a node, giving it the next serial
+    def stamp(self, node, value):
+        node.held = value
+        node.serial = self.tick
+        self.tick += 1
+
+    """
+    This locks a node to a value along with everything that locks because of 
+    it. Locking a node can complete parent groups of its children, which then
+    lock, which can complete groups of their children and so on. Rather than 
+    having each lock call the next (which runs out of stack on long chains of
+    nodes) we keep a worklist of the nodes waiting to lock and the values they
+    should lock to. Each child gets its value worked out when its group 
+    completes, just like before, and we take from the end of the list (putting
+    a node's children on in reverse) so the nodes still lock depth first, the 
+    way they did with the calls nested.
+    
+    If a node on the list is already locked we check that it is being locked 
+    to its own value, and let HandleDoubleLock know if it isn't.
+    """
+    def propagate(self, node, value):
+        pending = [(node, value)]
+        isLive = self.isLive
+        while pending:
+            node, value = pending.pop()
+            if node.serial is not None and isLive(node.serial):
+                if node.value != value:
+                    self.HandleDoubleLock(node, value)
+                continue
+            self.stamp(node, value)
+            # any child whose group this completes goes on the list (the node 
+            # was the last of its parents there to lock if they are all 
+            # locked now)
+            triggered = []
+            children = node.children
+            for key in range(0, len(children)):
+                for child in children[key]:
+                    for parent, multiplier in child.parent_groups[key]:
+                        serial = parent.serial
+                        if serial is None or (serial < self.era_start and not isLive(serial)):
+                            break
+                    else:
+                        triggered.append((child, child.groupValue(key)))
+            if triggered:
+                triggered.reverse()
+                pending.extend(triggered)
     
+    """
+    This locks a whole list of nodes at once (nodes[i] to values[i]), along 
+    with everything that locks because of them, as a single lock (so one 
+    RollBack undoes all of it). This is how a whole solution gets locked in:
+    rather than spreading each lock through the web on its own we work on 
+    every parent group at once.
+    
+    We use the web laid out in arrays (see Compile) and then, starting from 
+    the nodes we were given:
+        * count the locked parents of every group (a sum over each group)
+        * every node that isn't locked but has a group whose parents are now
+            all locked locks to that group's value, a sparse matrix-vector 
+            product of the group's multipliers with its parents' values (if 
+            more than one of its groups completes at once the first one wins)
+        * and repeat until nothing more locks (which only takes a couple of 
+            rounds: edge weights, then vertex cuts, then the cuts conditioned
+            on those)
+    Then every group that got completed by this but didn't decide the value 
+    of its node is checked by working out what it should be less what the 
+    node locked to. Any group where that residual isn't zero is a double lock
+    and goes in self.errors, just like HandleDoubleLock would do with it (as
+    does any node we were given that was already locked to something else).
+    
+    Last of all we lock the nodes themselves.
+    """
+    def LockAll(self, nodes, values):
+        if not nodes:
+            return
+        compiled = self.Compile()
+        owners, indptr, parents, multipliers = compiled.owners, compiled.indptr, compiled.parents, compiled.multipliers
+        # the groups that have been replaced never complete
+        sizes = np.where(compiled.live, np.diff(indptr), 0)
+        locked = np.array([node.lock for node in self.nodes], dtype=bool)
+        current = np.array([self.nodes[i].held if locked[i] else 0 for i in range(0, len(self.nodes))] + [0], dtype=object)[:-1]
+        was_locked = locked.copy()
+        counts_before = groupSums(indptr, locked[parents].astype(np.int64))
+        errors = []
+        for i in range(0, len(nodes)):
+            node = nodes[i]
+            if locked[node.id]:
+                if current[node.id] != values[i]:
+                    errors.append((node, values[i]))
+                continue
+            locked[node.id] = True
+            current[node.id] = values[i]
+        # now we spread the locks through the groups
+        while True:
+            counts = groupSums(indptr, locked[parents].astype(np.int64))
+            rows = np.nonzero((counts == sizes) & (sizes > 0) & ~locked[owners])[0]
+            if len(rows) == 0:
+                break
+            # the first group of each node to complete decides its value
+            rows = rows[np.unique(owners[rows], return_index=True)[1]]
+            current[owners[rows]] = groupValues(indptr, parents, multipliers, current, rows)
+            locked[owners[rows]] = True
+        # and we check the rest of the groups this completed
+        checked = np.nonzero((counts == sizes) & (sizes > 0) & (counts_before < sizes))[0]
+        if len(checked):
+            expected = groupValues(indptr, parents, multipliers, current, checked)
+            residuals = expected - current[owners[checked]]
+            for r in np.nonzero(residuals != 0)[0]:
+                errors.append((self.nodes[owners[checked[r]]], expected[r]))
+        self.errors.extend(errors)
+        # finally we lock the nodes
+        newly = np.nonzero(locked & ~was_locked)[0]
+        if len(newly) == 0:
+            return
+        self.locks.append((self.nodes[newly[0]], self.tick))
+        for id in newly:
+            self.stamp(self.nodes[id], current[id])
+
+    """
+    Every lock gets a serial number, one after the other, and a node is locked
+    exactly when its serial is live. So going back to the way things were at 
+    some point just means that every serial handed out since then is dead.
+    We keep the live serials as a handful of ranges (eras): the current one,
+    from era_start on, and the ones before it, and killing the serials from 
+    some point on just trims those ranges and starts a new era. So undoing 
+    any number of locks takes the same (tiny) amount of time and never 
+    touches the nodes, and unlocking everything just starts the one and only
+    era afresh.
+    
+    Checkpoint gives back a token for the state of the web as it is now, and
+    Restore takes the web back to the state of a token (undoing the locks, 
+    lock entries and errors since then). RollBack and Unlock work the same way.
+    """
+    def Checkpoint(self):
+        return (self.tick, len(self.locks), len(self.errors))
+
+    def Restore(self, checkpoint):
+        serial, num_locks, num_errors = checkpoint
+        self.retire(serial)
+        del self.locks[num_locks:]
+        del self.errors[num_errors:]
+        self.forgetChanged()
+
+    # this is whether a node with the given serial is locked
+    def isLive(self, serial):
+        if serial >= self.era_start:
+            return True
+        i = bisect_right(self.era_starts, serial) - 1
+        return i >= 0 and serial < self.era_ends[i]
+
+    # this kills every serial from the given one on
+    def retire(self, serial):
+        if serial >= self.tick:
+            return
+        if serial > self.era_start:
+            self.era_starts.append(self.era_start)
+            self.era_ends.append(serial)
+        else:
+            while self.era_starts and self.era_starts[-1] >= serial:
+                self.era_starts.pop(-1)
+                self.era_ends.pop(-1)
+            if self.era_ends and self.era_ends[-1] > serial:
+                self.era_ends[-1] = serial
+        self.era_start = self.tick
+
     # this allows you to go back to the state of your nodes before the most 
     # recent lock (this can be called repeatedly if you have made many locks    
     def RollBack(self):
         # first we empty errors NOTE THAT YOU SHOULD NOT KEEP GOING IF 
         # ERRORS EXIST!!!!
         self.errors = []
-        # we just have to unlock all the nodes in our last lock data set
-        for node in self.locks[-1][1]:
-            node.Unlock()
-        self.locks[-1][0].Unlock()
-        # and now we remove that lock data set
+        # we just have to unlock everything since our last lock
         last_data = self.locks.pop(-1)
+        self.retire(last_data[1])
         # we return the last actuated node for convenience
         return last_data[0]
     
@@ -199,10 +424,189 @@ class Web:
     
     # this rolls back all locks made so far
     def Unlock(self):
-        # this will rollback everything
-        while len(self.locks) > 0:
-            self.RollBack()
+        self.locks = []
+        self.errors = []
+        self.era_start = self.tick
+        self.era_starts = []
+        self.era_ends = []
+        self.forgetChanged()
+
+    # this drops the changes nobody has asked for yet. Whoever was keeping 
+    # track gets None from TakeChanged the next time, so they know to start 
+    # over, and if there was nothing to drop we just keep tracking
+    def forgetChanged(self):
+        if self.changed:
+            self.changed = None
 
                 
     
-        
\ No newline at end of file
+        
+
+"""
+This is a web laid out in arrays, so that we can work on all of its nodes and 
+groups at once instead of walking from node to node. For each node (by id) 
+there is:
+    * kinds: its kind as a number (an index into KINDS)
+    * weight_ids: its weight id if it is an edge weight (-1 otherwise)
+    * first_groups, num_groups: where its groups are (they are all together,
+        in order of their keys)
+    * edge_groups: where its edge group is (the first group whose first 
+        parent is an edge weight, which is the one whose edges make up the 
+        node), or -1 if it doesn't have one
+and for each group, in compressed sparse row form:
+    * parents[indptr[g]:indptr[g+1]], multipliers[indptr[g]:indptr[g+1]]: the
+        ids of its parents and their multipliers
+    * owners[g], keys[g]: the node it belongs to and its key there
+    * is_edge[g]: whether it is an edge group
+    * live[g]: whether it is still in use
+    
+The web only ever grows: nodes get added, and nodes get new groups and new 
+parents in their groups. So to bring the arrays up to date (see update) we 
+add on the new nodes and lay out afresh (at the end) the groups of every node
+that changed, leaving the old copies of those in place but no longer live. 
+When there are more groups out of use than in use we just start over. That 
+way keeping the arrays up to date takes time in proportion to how much the 
+web changed.
+"""
+KINDS = [None, 'vertex', 'edge']
+
+class CompiledWeb:
+
+    def __init__(self, web):
+        self.web = web
+        self.num_nodes = 0
+        self.kinds = np.zeros(0, dtype=np.int8)
+        self.weight_ids = np.zeros(0, dtype=np.int64)
+        self.first_groups = np.zeros(0, dtype=np.int64)
+        self.num_groups = np.zeros(0, dtype=np.int64)
+        self.edge_groups = np.zeros(0, dtype=np.int64)
+        # the groups are built up in lists and turned into arrays at the end
+        self.group_lists = ([], [], [0], [], [], [], [])
+        self.num_live = 0
+        self.update([])
+
+    def update(self, touched):
+        web = self.web
+        if self.num_live and len(self.group_lists[0]) - self.num_live > self.num_live:
+            # most of the groups are out of use, so we start over
+            self.__init__(web)
+            return
+        owners, keys, indptr, parents, multipliers, is_edge, live = self.group_lists
+        new = web.nodes[self.num_nodes:]
+        count = len(web.nodes)
+        self.kinds = np.resize(self.kinds, count)
+        self.weight_ids = np.resize(self.weight_ids, count)
+        self.first_groups = np.resize(self.first_groups, count)
+        self.num_groups = np.resize(self.num_groups, count)
+        self.edge_groups = np.resize(self.edge_groups, count)
+        for node in new:
+            self.kinds[node.id] = KINDS.index(node.kind)
+            self.weight_ids[node.id] = node.weight_id if node.kind == 'edge' else -1
+            self.first_groups[node.id] = len(owners)
+            self.num_groups[node.id] = 0
+            self.edge_groups[node.id] = -1
+        done = set()
+        for node in touched + new:
+            if node.id in done or not node.parent_groups:
+                continue
+            done.add(node.id)
+            # the old copies of its groups are no longer in use
+            first = self.first_groups[node.id]
+            for g in range(first, first + self.num_groups[node.id]):
+                live[g] = False
+                self.num_live -= 1
+            self.first_groups[node.id] = len(owners)
+            self.num_groups[node.id] = len(node.parent_groups)
+            self.edge_groups[node.id] = -1
+            for key in range(0, len(node.parent_groups)):
+                group = node.parent_groups[key]
+                edge = bool(group) and group[0][0].kind == 'edge'
+                if edge and self.edge_groups[node.id] < 0:
+                    self.edge_groups[node.id] = len(owners)
+                parents.extend([parent.id for parent, multiplier in group])
+                multipliers.extend([multiplier for parent, multiplier in group])
+                owners.append(node.id)
+                keys.append(key)
+                indptr.append(len(parents))
+                is_edge.append(edge)
+                live.append(True)
+                self.num_live += 1
+        self.num_nodes = count
+        self.owners = np.array(owners, dtype=np.int64)
+        self.keys = np.array(keys, dtype=np.int64)
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.parents = np.array(parents, dtype=np.int64)
+        self.multipliers = np.array(multipliers + [0], dtype=object)[:-1]
+        self.is_edge = np.array(is_edge, dtype=bool)
+        self.live = np.array(live, dtype=bool)
+
+    # this is the number of rows the linear system has (one for every group 
+    # that isn't an edge group, see Kirchhoff.GenerateLinearSystem)
+    def NumRows(self):
+        return int(np.count_nonzero(self.live & ~self.is_edge))
+
+    """
+    This builds the rows of the linear system for the given nodes (by id), 
+    following the algorithm described above Kirchhoff.GenerateLinearSystem,
+    but for all of them at once: each group of each node that isn't an edge group gives a row, 
+    which is each parent's multiplier times the edges in the parent's edge 
+    group, less the edges in the node's own edge group. It gives back the id
+    of the node each row belongs to and the rows (dictionaries of column -> 
+    value), in order.
+    """
+    def Rows(self, node_ids):
+        node_ids = np.asarray(node_ids, dtype=np.int64)
+        # the groups of those nodes that aren't edge groups, in order
+        groups = ranges(self.first_groups[node_ids], self.num_groups[node_ids])
+        groups = groups[~self.is_edge[groups]]
+        owners = self.owners[groups]
+        # first each parent's edges times the parent's multiplier
+        entries, rows = expand(self.indptr, groups)
+        edge_groups = self.edge_groups[self.parents[entries]]
+        has = edge_groups >= 0
+        edge_entries, positions = expand(self.indptr, edge_groups[has])
+        parent_rows = [rows[has][positions], self.weight_ids[self.parents[edge_entries]], self.multipliers[entries][has][positions] * self.multipliers[edge_entries]]
+        # and then less the node's own edges
+        own_groups = self.edge_groups[owners]
+        has = own_groups >= 0
+        own_entries, positions = expand(self.indptr, own_groups[has])
+        own_rows = [np.arange(0, len(groups))[has][positions], self.weight_ids[self.parents[own_entries]], -self.multipliers[own_entries]]
+        built = [{} for g in groups]
+        for row_ids, columns, values in [parent_rows, own_rows]:
+            row_ids = row_ids.tolist()
+            columns = columns.tolist()
+            for i in range(0, len(row_ids)):
+                row = built[row_ids[i]]
+                row[columns[i]] = row.get(columns[i], 0) + values[i]
+        return owners.tolist(), built
+
+# this gives back the numbers in each of the ranges [starts[i], starts[i] + 
+# lengths[i]), one range after the other
+def ranges(starts, lengths):
+    ends = np.cumsum(lengths)
+    total = int(ends[-1]) if len(ends) else 0
+    return np.repeat(starts - (ends - lengths), lengths) + np.arange(0, total, dtype=np.int64)
+
+# this gives back the positions (in parents or multipliers) of the entries of 
+# the given groups, one group after the other, along with which of the 
+# groups each is from
+def expand(indptr, groups):
+    lengths = indptr[groups + 1] - indptr[groups]
+    return ranges(indptr[groups], lengths), np.repeat(np.arange(0, len(groups)), lengths)
+
+# this adds up the entries of each group (laid out as in CompiledWeb), giving 
+# zero for an empty group
+def groupSums(indptr, entries):
+    sums = np.zeros(len(indptr) - 1, dtype=entries.dtype)
+    nonempty = np.nonzero(indptr[1:] > indptr[:-1])[0]
+    if len(nonempty):
+        sums[nonempty] = np.add.reduceat(entries, indptr[nonempty])
+    return sums
+
+# this works out the value of each of the given groups from the values of 
+# their parents (the sum of each parent's value times its multiplier)
+def groupValues(indptr, parents, multipliers, values, rows):
+    lengths = indptr[rows + 1] - indptr[rows]
+    entries = ranges(indptr[rows], lengths)
+    offsets = np.concatenate([np.zeros(1, dtype=np.int64), np.cumsum(lengths)])
+    return groupSums(offsets, multipliers[entries] * values[parents[entries]])
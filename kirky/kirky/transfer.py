@@ -0,0 +1,248 @@
+from fractions import Fraction
+from itertools import product
+import numpy as np
+from .issue import Issue
+from .modular import RandomPrime, ReduceModular, gcd
+
+"""
+This module finds out whether a block has any nullspace straight from the
+geometry of the block, without building the block or its linear system.
+
+Every block we build (the base block and anything Grow makes out of it) is a
+box: there is a vertex at every integer position from 0 up to the size of the
+box in each dimension, there is an edge of each independent vector k (the unit
+vector along dimension k) between every pair of vertices one apart along k, and
+an edge of each dependent vector i between every pair of vertices that are
+conditions[i] apart. If we call the weight of the edge of vector k that starts
+at x (and ends at x + delta_k) w_k(x), then each vertex x gives one row for
+each dependent vector i:
+
+    sum_j B[j,i] * (w_j(x) - w_j(x - delta_j)) - (w_m+i(x) - w_m+i(x - delta_m+i)) = 0
+
+(where any edge that isn't in the box is just left out). This is exactly the
+system Kirchhoff builds, up to flipping the sign of columns, which doesn't
+change the nullspace.
+
+The system looks the same everywhere in the box, which we take advantage of
+by sweeping through it one layer at a time along one dimension (like a
+transfer matrix). An edge belongs to the layer of its lower end, and a row at
+layer t only touches edges in layers t - width to t, where width is the
+furthest any vector reaches along the sweep. So once we are past layer
+t + width the edges in layer t are never touched again. We keep the rows we
+have seen so far, reduced modulo a prime, restricted to the edges that can
+still be touched, with the oldest edges on the left. After each layer any
+reduced row whose pivot is on an edge we are done with is independent of
+everything else that will ever come, so we count it towards the rank and throw
+it away along with the finished edges. What is left (the state) is never
+bigger than a few layers' worth of edges.
+
+In the middle of the box every layer is the same as the last one, just moved
+over by one. So if the state (relative to the layer we are on) ever repeats,
+it will keep repeating, with the rank going up by the same amount each time
+round. When we see that happen we skip ahead over as many whole periods as fit
+before the far side of the box. That is what lets us check really big boxes.
+
+Like ProbeNullity this gives the dimension of the nullspace modulo a prime,
+which is never smaller than the actual dimension, so zero means there is
+certainly no nullspace.
+"""
+
+"""
+This gives back the dimension of the nullspace (modulo the prime p, a random
+one if none is given) of the linear system of the box with the given sizes
+(the largest position along each dimension). B is the condition block and
+conditions is the matrix of (integer) dependent vectors, one per row, just like
+Kirchhoff takes them. If dimension isn't given we sweep along whichever
+dimension keeps the state smallest.
+"""
+def LatticeNullity(B, conditions, sizes, dimension=None, p=None):
+    if p is None:
+        p = RandomPrime()
+    lattice = Lattice(B, conditions, sizes)
+    if dimension is None:
+        dimension = lattice.BestDimension()
+    return lattice.NumColumns() - lattice.Rank(dimension, p)
+
+class Lattice:
+
+    def __init__(self, B, conditions, sizes):
+        self.dimension = B.shape[0]
+        self.num_dependent = B.shape[1]
+        if conditions.shape[0] != self.num_dependent or conditions.shape[1] != self.dimension:
+            raise Issue('conditions should have a row for each column of B')
+        self.sizes = [int(size) for size in sizes]
+        # these are the vectors each kind of edge goes along: the unit vectors
+        # first and then the dependent vectors
+        self.vectors = []
+        for j in range(0, self.dimension):
+            vector = [0] * self.dimension
+            vector[j] = 1
+            self.vectors.append(tuple(vector))
+        for i in range(0, self.num_dependent):
+            vector = []
+            for j in range(0, self.dimension):
+                value = Fraction(str(conditions[i, j]))
+                if value.denominator != 1:
+                    raise Issue('the dependent vectors should have integer entries')
+                vector.append(int(value))
+            self.vectors.append(tuple(vector))
+        # and these are the rows each vertex gives, as lists of (edge kind,
+        # multiplier) with each row scaled so that it is all integers
+        self.row_templates = []
+        for i in range(0, self.num_dependent):
+            multipliers = [Fraction(str(B[j, i])) for j in range(0, self.dimension)]
+            scale = 1
+            for multiplier in multipliers:
+                scale = scale * multiplier.denominator // gcd(scale, multiplier.denominator)
+            template = []
+            for j in range(0, self.dimension):
+                if multipliers[j]:
+                    template.append((j, int(multipliers[j] * scale)))
+            template.append((self.dimension + i, -scale))
+            self.row_templates.append(template)
+
+    # this checks whether a position is inside of the box
+    def inBox(self, position):
+        for d in range(0, self.dimension):
+            if position[d] < 0 or position[d] > self.sizes[d]:
+                return False
+        return True
+
+    # the number of edges (and so columns) in the box
+    def NumColumns(self):
+        count = 0
+        for vector in self.vectors:
+            edges = 1
+            for d in range(0, self.dimension):
+                edges *= max(0, self.sizes[d] + 1 - abs(vector[d]))
+            count += edges
+        return count
+
+    # how far any of the vectors reach along a dimension
+    def width(self, dimension):
+        return max([abs(vector[dimension]) for vector in self.vectors])
+
+    """
+    The state holds about (width + 1) layers of edges, so we pick the
+    dimension that makes that smallest (and the longest one if there is a
+    tie, since that is the one where skipping ahead helps most)
+    """
+    def BestDimension(self):
+        best = None
+        for d in range(0, self.dimension):
+            layer = 1
+            for other in range(0, self.dimension):
+                if other != d:
+                    layer *= self.sizes[other] + 1
+            key = ((self.width(d) + 1) * layer, -self.sizes[d])
+            if best is None or key < best[0]:
+                best = (key, d)
+        return best[1]
+
+    """
+    This sweeps through the box along the given dimension, as described at the
+    top of this module, and gives back the rank of the system modulo p
+    """
+    def Rank(self, dimension, p):
+        s = dimension
+        last = self.sizes[s]
+        width = self.width(s)
+        # these are the positions in a single layer, with the sweep coordinate
+        # set to zero
+        ranges = []
+        for d in range(0, self.dimension):
+            if d == s:
+                ranges.append([0])
+            else:
+                ranges.append(range(0, self.sizes[d] + 1))
+        section = [list(position) for position in product(*ranges)]
+        rank = 0
+        # the edges that can still be touched, oldest first (each is the kind
+        # of edge and where it starts), and the reduced rows restricted to them
+        active = []
+        layers = []
+        state = np.zeros((0, 0), dtype=np.int64)
+        seen = {}
+        t = 0
+        while t <= last:
+            # first we add the edges whose lower end is in this layer
+            new = []
+            for k in range(0, len(self.vectors)):
+                vector = self.vectors[k]
+                for position in section:
+                    start = list(position)
+                    start[s] = t - min(0, vector[s])
+                    end = [start[d] + vector[d] for d in range(0, self.dimension)]
+                    if self.inBox(start) and self.inBox(end):
+                        new.append((k, tuple(start)))
+            active.extend(new)
+            layers.extend([t] * len(new))
+            columns = {}
+            for c in range(0, len(active)):
+                columns[active[c]] = c
+            # then the rows for each vertex in this layer
+            rows = []
+            for position in section:
+                vertex = list(position)
+                vertex[s] = t
+                for template in self.row_templates:
+                    row = {}
+                    for k, multiplier in template:
+                        vector = self.vectors[k]
+                        out = columns.get((k, tuple(vertex)))
+                        if out is not None:
+                            row[out] = row.get(out, 0) + multiplier
+                        if any(vector):
+                            into = columns.get((k, tuple([vertex[d] - vector[d] for d in range(0, self.dimension)])))
+                            if into is not None:
+                                row[into] = row.get(into, 0) - multiplier
+                    rows.append(row)
+            matrix = np.zeros((state.shape[0] + len(rows), len(active)), dtype=np.int64)
+            matrix[:state.shape[0], :state.shape[1]] = state
+            for r in range(0, len(rows)):
+                for c in rows[r]:
+                    matrix[state.shape[0] + r, c] = rows[r][c] % p
+            pivots = ReduceModular(matrix, p)
+            # now we let go of the edges no later row can touch. The rows with
+            # their pivot on one of them count towards the rank
+            finished = 0
+            while finished < len(layers) and layers[finished] <= t - width:
+                finished += 1
+            done = 0
+            while done < len(pivots) and pivots[done] < finished:
+                done += 1
+            rank += done
+            state = matrix[done:len(pivots), finished:]
+            active = active[finished:]
+            layers = layers[finished:]
+            # if the next layers are all the same as this one we look to see
+            # if we have been in this state before
+            if width <= t + 1 and t + 1 <= last - width:
+                key = self.stateKey(state, active, s, t)
+                if key in seen:
+                    period = t - seen[key][0]
+                    gain = rank - seen[key][1]
+                    skip = (last - width - t) // period
+                    if skip > 0:
+                        shift = skip * period
+                        t += shift
+                        rank += skip * gain
+                        active = [(k, self.moved(start, s, shift)) for k, start in active]
+                        layers = [layer + shift for layer in layers]
+                    seen = {}
+                else:
+                    seen[key] = (t, rank)
+            t += 1
+        # everything left over is independent
+        return rank + state.shape[0]
+
+    # this describes the state relative to the layer t, so that it can be
+    # compared with the state at any other layer
+    def stateKey(self, state, active, s, t):
+        relative = tuple([(k, self.moved(start, s, -t)) for k, start in active])
+        return (relative, state.shape, state.tobytes())
+
+    def moved(self, position, s, shift):
+        position = list(position)
+        position[s] += shift
+        return tuple(position)
@@ -1,92 +1,100 @@
+import numpy as np
 from symbolic import Web
 from issue import Issue
 
-class Vertex:
-
-    def __init__(self, position):
-        self.position = position
-        self.cut = []
-        # this holds for each corresponding entry in cut the key of the 
-        # group you should add an edges weight symbolic node to
-        self.cut_group_keys = []
-        # this lists elements will be lists of length two holding in their 
-        # first position the edge of the corresponding vector going out 
-        # (if it exists) and in the second the edge of the corresponding 
-        # vector coming in
-        self.edges = []
-    
-    """
-    adding an edge will only go through if such an edge hasn't been added 
-    already. If the edge doesn't exist it will be added and its weight node 
-    added as parent to the corresponding entry in the cut (determined by 
-    vector id) with a multiplier of 1 if it is leaving the vertex and a 
-    multiplier of -1 if it is entering.
-    
-    Note that if this is the first edge of this vector id being added to the 
-    vertex, a new parent group will be created and its key kept in 
-    self.cut_group_keys. This key will be used to add a future edge weight 
-    corresponding to an edge of this vector id thereby making sure that 
-    all edge weights corresponding to the same vector id are added to the 
-    same parent group
-    
-    If the addition was successful, True is returned, if not False is returned
-    """
+"""
+A vertex doesn't hold any state of its own. Everything about the vertices 
+lives in arrays in the VertexPool (see below), and a Vertex is just a view of 
+one of them (by its id, the row it has in those arrays) that gets made when 
+someone asks for it. So you can make as many as you like and throw them away,
+and two views of the same vertex are equal.
+
+The view gives you the same things a vertex always had:
+    * position: the tuple of its (integer) coordinates
+    * cut: the list of web nodes making up its vertex cut (None for an entry 
+        that doesn't have a node, which means it is zero, see 
+        VertexPool.CutNode)
+    * cut_group_keys: for each entry in cut, the key of the parent group the 
+        edge weights of that vector get added to (or None if there isn't one
+        yet)
+    * edges: for each vector, a list of length two holding the edge of that 
+        vector going out (if it exists) and the edge coming in
+"""
+class Vertex(object):
+
+    __slots__ = ('pool', 'id')
+
+    def __init__(self, pool, id):
+        self.pool = pool
+        self.id = id
+
+    @property
+    def position(self):
+        return tuple(self.pool.coords[self.id].tolist())
+
+    @property
+    def cut(self):
+        nodes = self.pool.web.nodes
+        cut = []
+        for node_id in self.pool.cut_nodes[self.id]:
+            if node_id < 0:
+                cut.append(None)
+            else:
+                cut.append(nodes[node_id])
+        return cut
+
+    @property
+    def cut_group_keys(self):
+        keys = []
+        for key in self.pool.cut_group_keys[self.id]:
+            if key < 0:
+                keys.append(None)
+            else:
+                keys.append(int(key))
+        return keys
+
+    @property
+    def edges(self):
+        edges = self.pool.edge_pool.edges
+        slots = []
+        for slot in self.pool.edge_slots[self.id]:
+            pair = []
+            for weight_id in slot:
+                if weight_id < 0:
+                    pair.append(None)
+                else:
+                    pair.append(edges[weight_id])
+            slots.append(pair)
+        return slots
+
+    # see VertexPool.AddEdge
     def AddEdge(self, edge):
-        # first we get the vector_id
-        vector_id = edge.vector_id
-        # now we are going to do two things, make sure that the vertex does 
-        # touch the edge in some way, and that we don't already have an edge 
-        # of this type yet
-        if self.position == edge.tail_position:
-            if not self.edges[vector_id][0]:
-                # first we add the edge to edges
-                self.edges[vector_id][0] = edge
-                # next we attach its weight to the specific node in the cut
-                # with a positive value because this edge is leading out.
-                # we first make sure a key is there
-                if not self.cut_group_keys[vector_id] and self.cut_group_keys[vector_id] != 0:
-                    self.cut_group_keys[vector_id] = self.cut[vector_id].CreateParentGroup()
-                multiplier = 1
-                parent = edge.weight
-                self.cut[vector_id].AddParent(self.cut_group_keys[vector_id], (parent, multiplier))
-                return True # this is to allow another object to know that the edge was accepted
-        elif self.position == edge.head_position:
-            if not self.edges[vector_id][1]:
-                # first we add the edge to edges
-                self.edges[vector_id][1] = edge
-                # next we attach its weight to the specific node in the cut
-                # with a negative value because this edge is leading in.
-                # we first make sure a key is there
-                if not self.cut_group_keys[vector_id] and self.cut_group_keys[vector_id] != 0:
-                    self.cut_group_keys[vector_id] = self.cut[vector_id].CreateParentGroup()
-                multiplier = -1
-                parent = edge.weight
-                self.cut[vector_id].AddParent(self.cut_group_keys[vector_id], (parent, multiplier))
-                return True # this is to allow another object to know that the edge was accepted
-        else:
-            raise Issue('the edge you are adding onto this vertex does not touch the vertex')
-        return False # to show that the edge wasn't accepted
+        return self.pool.AddEdge(self.id, edge)
     
     def IsLocked(self):
         for node in self.cut:
-            if not node.lock:
+            if node is None or not node.lock:
                 return False
         return True
 
     def __str__(self):
-        return '%s' % self.position
+        return '%s' % (self.position,)
 
     def __hash__(self):
-        return hash(str(self))
+        return hash((id(self.pool), self.id))
 
     def __repr__(self):
         return str(self)
 
+    # two views of the same pool are the same vertex exactly when they have 
+    # the same id, so we only need to look at positions across pools
     def __eq__(self, other):
-        if self.position == other.position:
-            return True
-        else:
-            return False
+        if self.pool is other.pool:
+            return self.id == other.id
+        return self.position == other.position
+
+    def __ne__(self, other):
+        return not self == other
         
 """
 The following class indexes objects by their position. It takes as
@@ -175,23 +183,103 @@ class Index:
         # if we didn't find anything we return None
         return None
 
+"""
+The following class also indexes objects by their position, but instead of 
+walking down a chain of maps keyed by strings and then searching a list, it 
+keys a single dictionary by the position itself, turned into a tuple of 
+python integers. So adding and finding an element is a single hash lookup.
+
+Note this means positions must be lattice points (every entry a whole number,
+though it can be an int, a Fraction or a sympy Integer). It has the same 
+AddElement and GetElement methods as Index so it can be used in its place.
+"""
+
+class PositionIndex:
+
+    def __init__(self):
+        self.elements = {}
+
+    def AddElement(self, element):
+        key = PositionKey(element.position)
+        if not key in self.elements:
+            self.elements[key] = element
+
+    def GetElement(self, position):
+        return self.elements.get(PositionKey(position))
+
+    def __len__(self):
+        return len(self.elements)
+
+# this turns a position into the key PositionIndex uses for it, which is also 
+# how positions are kept in blocks: a tuple of python ints. Every entry has to
+# be a whole number (rounding anything else would quietly put it on top of 
+# some other position)
+def PositionKey(position):
+    key = tuple([int(entry) for entry in position])
+    if key != tuple(position):
+        raise Issue('positions have to be whole numbers, %s is not' % (tuple(position),))
+    return key
+
 """
 This class handles the creation of new vertices and holds collective 
-state about them
+state about them. 
+
+Rather than keeping an object for every vertex, everything about the vertices 
+is kept in numpy arrays with a row for each vertex (its id):
+    * coords: the integer position of each vertex
+    * cut_nodes: the ids of the web nodes making up each vertex's cut, or -1
+        for an entry that doesn't have a node (yet)
+    * cut_group_keys: for each entry in a cut the key of the parent group 
+        edge weights get added to, or -1 if there isn't one yet
+    * edge_slots: for each vector, the weight id (see EdgePool) of the edge 
+        of that vector going out of the vertex and of the one coming in, or 
+        -1 if there isn't one
+The arrays grow by doubling so adding vertices is cheap. On top of that the
+bounding box of the vertices is mapped out by a dense grid holding the id of 
+the vertex at each position (or -1), so finding a vertex is just a lookup in 
+the grid. All of this comes to a few bytes for each slot in each cut.
+
+Vertex objects are made on demand as views into these arrays.
 """
 class VertexPool:
 
     # condition block should be a sympy matrix it is the B portion of [IB]
+    # (r was the bucket width of the old Index, we no longer need it)
     def __init__(self, condition_block, r=2):
         self.condition_block = condition_block
         # the dimension of our space is equal to the number of rows
         # in our condition_block
         self.dimension = self.condition_block.shape[0]
         self.cut_size = self.condition_block.shape[0] + self.condition_block.shape[1]
+        # we pull the entries of the condition block out once, since indexing 
+        # a sympy matrix is slow and every cut needs all of them
+        self.multipliers = [[self.condition_block[j,i] for j in range(0, self.dimension)] for i in range(0, self.condition_block.shape[1])]
+        # this is the relation between the entries of every cut: for each 
+        # conditioned entry the (entry, multiplier) pairs it depends on, and 
+        # for each of the first entries the conditioned entries that depend 
+        # on it
+        self.template = []
+        self.dependents = [[] for j in range(0, self.dimension)]
+        for i in range(0, self.condition_block.shape[1]):
+            pairs = []
+            for j in range(0, self.dimension):
+                if self.multipliers[i][j] != 0:
+                    pairs.append((j, self.multipliers[i][j]))
+                    self.dependents[j].append(i)
+            self.template.append(pairs)
         
         # we prepare ourself for the vertices
-        self.vertices = []
-        self.index = Index(r,0,self.dimension)
+        self.num_vertices = 0
+        self.coords = np.zeros((0, self.dimension), dtype=np.int64)
+        self.cut_nodes = np.zeros((0, self.cut_size), dtype=np.int32)
+        self.cut_group_keys = np.zeros((0, self.cut_size), dtype=np.int32)
+        self.edge_slots = np.zeros((0, self.cut_size, 2), dtype=np.int32)
+        # the grid covers the positions from grid_origin on
+        self.grid_origin = np.zeros(self.dimension, dtype=np.int64)
+        self.grid = np.zeros((0,) * self.dimension, dtype=np.int32)
+        # this is the edge pool whose weight ids go in the edge slots (the 
+        # block sets this)
+        self.edge_pool = None
         
         # we prepare the web of symbolic nodes that we are 
         # going to be generating
@@ -200,7 +288,10 @@ class VertexPool:
         # this will hold the maximum values of position vector entries in a 
         # particular dimension
         self.size = [0] * self.dimension
-    
+
+    # this gives back views of all of the vertices in the order they were made
+    def Vertices(self):
+        return [Vertex(self, id) for id in range(0, self.num_vertices)]
     """
     Each vertex has a vertex cut. If there are n vectors 
     in your block, then the vertex cut has n spots each of 
@@ -224,69 +315,209 @@ class VertexPool:
     where the parents are the first m nodes in the cut and the multipliers for 
     the parent node representing the jth entry in the cut is [IB][j,i]. 
     
-    And the following method creates lists of nodes just like this.
+    This relation is the same for every vertex, so we only keep it once (in 
+    self.template, see __init__) and we don't make the nodes of a cut until 
+    we need them. Most entries of most cuts never have an edge touching them,
+    and such an entry is just zero, so there is no reason to make a node for 
+    it. The following method makes the node for one entry of one cut (if it 
+    isn't there already) and gives it back. We need it when:
+        * an edge attaches to the entry
+        * the entry is one of the first m, and so the entries conditioned on 
+            it need to exist (so that their rows end up in the linear system)
+    A conditioned entry gets a parent group holding whichever of the entries 
+    it is conditioned on exist, and an entry that gets made later is added to 
+    the groups of the entries conditioned on it. Leaving the rest out changes 
+    nothing, since with no edges they are zero anyway.
     """  
-    def createCut(self):
-        # here is where we create a new cut for a vertex
-        # first we create a bunch of brand new symbolic nodes 
-        # to act as our independent first m entries in this cut
-        cut = []
-        for i in range(0, self.dimension):
-            node = self.web.CreateNode()
-            node.kind = 'vertex'
-            cut.append(node)
-            
-        # now we create the rest of the entries (which of course are conditioned
-        # on the first m
-        for i in range(0, self.condition_block.shape[1]):
-            node = self.web.CreateNode()
-            node.kind = 'vertex'
-            # now we add in our conditions
-            # we create the new parent group for these conditions
-            group_key = node.CreateParentGroup()
-            # now we go ahead and add the parents and their multiples
-            for j in range(0, self.dimension):
-                multiplier = self.condition_block[j,i]
-                parent = cut[j]
-                node.AddParent(group_key, (parent, multiplier))
-            cut.append(node)
-        # and our cut has been created!
-        return cut
+    def CutNode(self, id, slot):
+        node_id = self.cut_nodes[id, slot]
+        if node_id >= 0:
+            return self.web.nodes[node_id]
+        node = self.web.CreateNode()
+        node.kind = 'vertex'
+        self.cut_nodes[id, slot] = node.id
+        if slot < self.dimension:
+            # the entries conditioned on this one need to know about it
+            for i in self.dependents[slot]:
+                dependent_id = self.cut_nodes[id, self.dimension + i]
+                if dependent_id >= 0:
+                    dependent = self.web.nodes[dependent_id]
+                    key = self.conditionGroup(dependent)
+                    dependent.AddParent(key, (node, self.multipliers[i][slot]))
+                else:
+                    self.CutNode(id, self.dimension + i)
+        else:
+            # we create the new parent group for the conditions and add in 
+            # the entries it depends on that we already have
+            i = slot - self.dimension
+            key = node.CreateParentGroup()
+            for j, multiplier in self.template[i]:
+                parent_id = self.cut_nodes[id, j]
+                if parent_id >= 0:
+                    node.AddParent(key, (self.web.nodes[parent_id], multiplier))
+        return node
+
+    # this finds the key of the conditions parent group of a conditioned cut 
+    # node (the one that doesn't hold edge weights)
+    def conditionGroup(self, node):
+        for key in range(0, len(node.parent_groups)):
+            group = node.parent_groups[key]
+            if not group or group[0][0].kind != 'edge':
+                return key
     
     """
-    this will get the currently indexed vertex or, if does not exist, create 
-    a new vertex and index it
+    this will get the vertex at a position or, if does not exist, create 
+    a new vertex there
     
     This is how new vertices should be created
     """
     def GetVertex(self, position):
-        index_vertex = self.index.GetElement(position)
-        if not index_vertex:
-            vertex = Vertex(position)
-            cut = self.createCut()
-            vertex.cut = cut
-            # we initialize the cut group keys
-            vertex.cut_group_keys = [None] * len(cut)
-            # we initialize edges
-            for i in range(0, len(cut)):
-                vertex.edges.append([None, None])
-            # now we are going to handle adding a vertex
-            self.index.AddElement(vertex)
-            self.vertices.append(vertex)
-            # now we see if we need to adjust the any of the sizes
-            for i in range(0, len(position)):
-                if position[i] > self.size[i]:
-                    self.size[i] = position[i]
-            return vertex
-        else: 
-            return index_vertex
+        # positions in the blocks are already tuples of ints
+        key = position if type(position) is tuple else PositionKey(position)
+        id = self.findId(key)
+        if id >= 0:
+            return Vertex(self, id)
+        id = self.num_vertices
+        self.reserve(id + 1)
+        self.coords[id] = key
+        # the nodes of the cut get made as they are needed (see CutNode)
+        self.cut_nodes[id] = -1
+        self.cut_group_keys[id] = -1
+        self.edge_slots[id] = -1
+        self.num_vertices += 1
+        self.coverGrid(key)
+        self.grid[tuple(np.array(key) - self.grid_origin)] = id
+        # now we see if we need to adjust the any of the sizes
+        for i in range(0, len(key)):
+            if key[i] > self.size[i]:
+                self.size[i] = key[i]
+        return Vertex(self, id)
+
     """
     This looks to see if there is a vertex at the given position
     """ 
     def HasVertex(self, position):
-        # this will check to see if a vertex exists
-        index_vertex = self.index.GetElement(position)
-        if index_vertex:
-            return True
+        return self.findId(PositionKey(position)) >= 0
+
+    """
+    adding an edge will only go through if such an edge hasn't been added 
+    already. If the edge doesn't exist it will be added and its weight node 
+    added as parent to the corresponding entry in the cut (determined by 
+    vector id) with a multiplier of 1 if it is leaving the vertex and a 
+    multiplier of -1 if it is entering.
+    
+    Note that if this is the first edge of this vector id being added to the 
+    vertex, a new parent group will be created and its key kept in 
+    self.cut_group_keys. This key will be used to add a future edge weight 
+    corresponding to an edge of this vector id thereby making sure that 
+    all edge weights corresponding to the same vector id are added to the 
+    same parent group
+    
+    If the addition was successful, True is returned, if not False is returned
+    """
+    def AddEdge(self, id, edge):
+        vector_id = edge.vector_id
+        position = tuple(self.coords[id].tolist())
+        # we make sure that the vertex does touch the edge, and find out 
+        # whether the edge is leaving it or entering it
+        if position == edge.tail_position:
+            direction = 0
+            multiplier = 1
+        elif position == edge.head_position:
+            direction = 1
+            multiplier = -1
         else:
-            return False
\ No newline at end of file
+            raise Issue('the edge you are adding onto this vertex does not touch the vertex')
+        if self.edge_slots[id, vector_id, direction] >= 0:
+            return False # to show that the edge wasn't accepted
+        self.attach(id, edge, direction, multiplier)
+        return True # this is to allow another object to know that the edge was accepted
+
+    # this puts an edge in a slot of a vertex (which we already know is free)
+    # and attaches its weight to the right node in the cut, first making sure
+    # a key is there
+    def attach(self, id, edge, direction, multiplier):
+        vector_id = edge.vector_id
+        self.edge_slots[id, vector_id, direction] = edge.weight.weight_id
+        node = self.CutNode(id, vector_id)
+        key = int(self.cut_group_keys[id, vector_id])
+        if key < 0:
+            key = node.CreateParentGroup()
+            self.cut_group_keys[id, vector_id] = key
+        node.AddParent(key, (edge.weight, multiplier))
+
+    """
+    This adds an edge between the vertices with the given ids when we already 
+    know the edge is new (so neither slot it goes in is taken). It skips all of
+    the checks AddEdge does, which makes it a good deal faster when building 
+    a lot of edges we know about in advance (see extendBoxBlocks)
+    """
+    def AddNewEdge(self, tail_id, head_id, edge):
+        edge.vertices[0] = Vertex(self, tail_id)
+        edge.vertices[1] = Vertex(self, head_id)
+        self.attach(tail_id, edge, 0, 1)
+        self.attach(head_id, edge, 1, -1)
+
+    # this gives back the id of the vertex at a position (given as a tuple of
+    # ints) or -1 if there isn't one
+    def findId(self, key):
+        index = []
+        for i in range(0, self.dimension):
+            offset = key[i] - self.grid_origin[i]
+            if offset < 0 or offset >= self.grid.shape[i]:
+                return -1
+            index.append(offset)
+        return int(self.grid[tuple(index)])
+
+    # this does the same as findId for a whole array of positions (one per 
+    # row) at once, giving back an array of ids
+    def FindIds(self, keys):
+        ids = -np.ones(len(keys), dtype=np.int64)
+        if self.num_vertices == 0 or len(keys) == 0:
+            return ids
+        offsets = np.asarray(keys, dtype=np.int64) - self.grid_origin
+        inside = ((offsets >= 0) & (offsets < np.array(self.grid.shape))).all(axis=1)
+        ids[inside] = self.grid[tuple(offsets[inside].T)]
+        return ids
+
+    # this makes sure the arrays have room for count vertices
+    def reserve(self, count):
+        capacity = self.coords.shape[0]
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity, 16)
+        self.coords = grow(self.coords, capacity)
+        self.cut_nodes = grow(self.cut_nodes, capacity)
+        self.cut_group_keys = grow(self.cut_group_keys, capacity)
+        self.edge_slots = grow(self.edge_slots, capacity)
+
+    # this makes sure the grid covers the position key, growing it if it 
+    # needs to (to twice its size along any dimension it outgrew, so this 
+    # doesn't happen often)
+    def coverGrid(self, key):
+        if self.num_vertices == 1:
+            self.grid_origin = np.array(key, dtype=np.int64)
+            self.grid = -np.ones((1,) * self.dimension, dtype=np.int32)
+            return
+        lower = np.minimum(self.grid_origin, key)
+        upper = np.maximum(self.grid_origin + self.grid.shape, np.array(key) + 1)
+        if (lower == self.grid_origin).all() and (upper == self.grid_origin + self.grid.shape).all():
+            return
+        shape = []
+        for i in range(0, self.dimension):
+            extent = upper[i] - lower[i]
+            if extent > self.grid.shape[i]:
+                extent = max(extent, 2 * self.grid.shape[i])
+            shape.append(int(extent))
+        grid = -np.ones(shape, dtype=np.int32)
+        offset = self.grid_origin - lower
+        region = tuple([slice(offset[i], offset[i] + self.grid.shape[i]) for i in range(0, self.dimension)])
+        grid[region] = self.grid
+        self.grid = grid
+        self.grid_origin = lower
+
+# this gives back a copy of array with room for capacity rows
+def grow(array, capacity):
+    bigger = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    bigger[:array.shape[0]] = array
+    return bigger
@@ -10,6 +10,8 @@ setup(name='kirky',
         packages=['kirky'],
         install_requires=[
             'sympy',
+            'numpy',
+            'futures; python_version < "3"',
             'pyx==0.12.1'
         ],
         zip_safe=False)